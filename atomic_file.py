@@ -0,0 +1,19 @@
+import os
+from contextlib import contextmanager
+
+@contextmanager
+def atomic_write(path, mode="wb"):
+    """Open a temporary file beside path and move it over path once the block completes.
+
+    Readers see either the old file or the complete new one. If the block raises, the
+    temporary file is removed and path is left as it was.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    partial_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(partial_path, mode) as f:
+            yield f
+        os.replace(partial_path, path)
+    finally:
+        if os.path.exists(partial_path):
+            os.unlink(partial_path)
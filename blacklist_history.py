@@ -0,0 +1,192 @@
+import os
+import time
+import sqlite3
+import argparse
+import ipaddress
+import blacklist_snapshot
+
+HISTORY_PATH = "/var/lib/firewall/history.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS versions (
+    id INTEGER PRIMARY KEY,
+    day TEXT UNIQUE NOT NULL,
+    feed_hash BLOB,
+    added INTEGER NOT NULL DEFAULT 0,
+    removed INTEGER NOT NULL DEFAULT 0,
+    delta BLOB
+);
+CREATE TABLE IF NOT EXISTS entries (id INTEGER PRIMARY KEY, record BLOB UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS events (
+    entry INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    added INTEGER NOT NULL,
+    PRIMARY KEY (entry, version)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS events_by_version ON events (version, entry);
+CREATE TABLE IF NOT EXISTS listed (entry INTEGER PRIMARY KEY);
+"""
+
+def entry_record(entry):
+    """Return the packed record of a blacklist entry: its big-endian network address and prefix length."""
+    version, first, prefix = blacklist_snapshot.packed_entry(entry)
+    return first.to_bytes(blacklist_snapshot.WIDTHS[version], "big") + bytes([prefix])
+
+def record_string(record):
+    """Format a packed record back into an entry string."""
+    return blacklist_snapshot.network_string(record[:-1], record[-1:])
+
+class BlacklistHistory:
+    """Daily blacklist versions stored as compressed deltas, indexed for diffs and timelines.
+
+    Each day is one version holding the entries added and removed since the previous day,
+    both as a zlib-compressed varint-gap blob and as rows of the events table. The events
+    table is keyed by entry for timelines and indexed by version for range diffs.
+    """
+
+    def __init__(self, path=HISTORY_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def record(self, ip_list, feed_hash=None, day=None):
+        """Record ip_list as the state of day (today by default) and return its version id.
+
+        Recording the same day again folds the new changes into that day's version.
+        """
+        day = day or time.strftime("%Y-%m-%d")
+        records = {entry_record(entry) for entry in ip_list}
+        ids = dict(self.db.execute("SELECT record, id FROM entries"))
+        listed = {record for record, in self.db.execute(
+            "SELECT record FROM listed JOIN entries ON entries.id = listed.entry")}
+        added, removed = records - listed, listed - records
+        with self.db:
+            row = self.db.execute("SELECT id FROM versions WHERE day = ?", (day,)).fetchone()
+            if row is None:
+                version = self.db.execute("INSERT INTO versions (day) VALUES (?)", (day,)).lastrowid
+            else:
+                version = row[0]
+            new_entries = [(len(ids) + i + 1, record) for i, record in
+                           enumerate(record for record in added if record not in ids)]
+            self.db.executemany("INSERT INTO entries (id, record) VALUES (?, ?)", new_entries)
+            ids.update((record, entry_id) for entry_id, record in new_entries)
+            # An entry changed back within the same version cancels its earlier event.
+            earlier = dict(self.db.execute("SELECT entry, added FROM events WHERE version = ?", (version,)))
+            inserts, deletes = [], []
+            for records_changed, is_added in ((added, 1), (removed, 0)):
+                for record in records_changed:
+                    entry_id = ids[record]
+                    if entry_id in earlier:
+                        deletes.append((entry_id, version))
+                    else:
+                        inserts.append((entry_id, version, is_added))
+            self.db.executemany("DELETE FROM events WHERE entry = ? AND version = ?", deletes)
+            self.db.executemany("INSERT INTO events (entry, version, added) VALUES (?, ?, ?)", inserts)
+            self.db.executemany("INSERT INTO listed (entry) VALUES (?)", ((ids[r],) for r in added))
+            self.db.executemany("DELETE FROM listed WHERE entry = ?", ((ids[r],) for r in removed))
+            self.update_delta(version, feed_hash)
+        print(f"Recorded blacklist history for {day}: +{len(added)}/-{len(removed)}.")
+        return version
+
+    def update_delta(self, version, feed_hash):
+        """Re-encode the compressed delta of a version from its events."""
+        changes = []
+        for record, is_added in self.db.execute(
+                "SELECT record, added FROM events JOIN entries ON entries.id = events.entry "
+                "WHERE version = ?", (version,)):
+            family = 4 if len(record) == 5 else 6
+            changes.append((bool(is_added), family, record[:-1], record[-1:]))
+        added = sum(1 for change in changes if change[0])
+        feed_hash = feed_hash or bytes(32)
+        self.db.execute("UPDATE versions SET feed_hash = ?, added = ?, removed = ?, delta = ? WHERE id = ?",
+                        (feed_hash, added, len(changes) - added,
+                         blacklist_snapshot.encode_delta(feed_hash, changes), version))
+
+    def versions(self):
+        """Return (version, day, added, removed) for every recorded version, oldest first."""
+        return self.db.execute("SELECT id, day, added, removed FROM versions ORDER BY id").fetchall()
+
+    def version_on(self, day):
+        """Return the id of the latest version recorded on or before day."""
+        row = self.db.execute("SELECT MAX(id) FROM versions WHERE day <= ?", (day,)).fetchone()
+        return row[0] or 0
+
+    def entries_at(self, version):
+        """Rebuild the entries listed at a version by replaying the compressed deltas."""
+        entries = set()
+        for delta, in self.db.execute("SELECT delta FROM versions WHERE id <= ? ORDER BY id", (version,)):
+            _, added, removed = blacklist_snapshot.decode_delta(delta)
+            entries -= removed
+            entries |= added
+        return entries
+
+    def diff(self, first, second):
+        """Return (added, removed) entries between two version ids, using the version index.
+
+        Only events recorded after first and up to second are read. An entry whose first
+        and last event in that range differ ended where it started and is left out.
+        """
+        added, removed = [], []
+        last_entry = None
+        rows = self.db.execute(
+            "SELECT entry, added, record FROM events JOIN entries ON entries.id = events.entry "
+            "WHERE version > ? AND version <= ? ORDER BY entry, version", (first, second))
+        for entry_id, is_added, record in rows:
+            if entry_id != last_entry:
+                if last_entry is not None and start == end:
+                    (added if end else removed).append(record_string(last_record))
+                last_entry, start = entry_id, is_added
+            end, last_record = is_added, record
+        if last_entry is not None and start == end:
+            (added if end else removed).append(record_string(last_record))
+        return added, removed
+
+    def timeline(self, value):
+        """Return (day, entry, listed) events for an entry, or every network covering an address."""
+        if "/" in value:
+            records = [entry_record(str(ipaddress.ip_network(value, strict=False)))]
+        else:
+            address = ipaddress.ip_address(value)
+            bits = address.max_prefixlen
+            records = [((int(address) >> (bits - prefix)) << (bits - prefix)).to_bytes(bits // 8, "big")
+                       + bytes([prefix]) for prefix in range(bits + 1)]
+        placeholders = ", ".join("?" * len(records))
+        rows = self.db.execute(
+            "SELECT day, record, events.added FROM events "
+            "JOIN entries ON entries.id = events.entry JOIN versions ON versions.id = events.version "
+            f"WHERE record IN ({placeholders}) ORDER BY version", records)
+        return [(day, record_string(record), bool(is_added)) for day, record, is_added in rows]
+
+    def close(self):
+        self.db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the blacklist history.")
+    parser.add_argument("--path", default=HISTORY_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("versions", help="list recorded versions")
+    diff_parser = subparsers.add_parser("diff", help="entries added and removed between two days")
+    diff_parser.add_argument("since", help="YYYY-MM-DD")
+    diff_parser.add_argument("until", help="YYYY-MM-DD")
+    timeline_parser = subparsers.add_parser("timeline", help="listing history of an address or network")
+    timeline_parser.add_argument("value")
+    args = parser.parse_args()
+    history = BlacklistHistory(args.path)
+    try:
+        if args.command == "versions":
+            for version, day, added, removed in history.versions():
+                print(f"{version}: {day} +{added}/-{removed}")
+        elif args.command == "diff":
+            added, removed = history.diff(history.version_on(args.since), history.version_on(args.until))
+            for entry in sorted(added):
+                print(f"+{entry}")
+            for entry in sorted(removed):
+                print(f"-{entry}")
+        else:
+            for day, entry, listed in history.timeline(args.value):
+                print(f"{day} {'listed' if listed else 'delisted'} {entry}")
+    finally:
+        history.close()
+
+if __name__ == "__main__":
+    main()
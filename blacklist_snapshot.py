@@ -0,0 +1,325 @@
+import os
+import mmap
+import zlib
+import socket
+import struct
+import hashlib
+import argparse
+import ipaddress
+from bisect import bisect_right
+from atomic_file import atomic_write
+
+SNAPSHOT_DIR = "/var/lib/firewall/snapshots"
+SNAPSHOT_HISTORY = 10  # Versions kept: the newest in full, older ones as reverse deltas
+MAGIC = b"BLSNAP01"
+# Magic, SHA-256 of the feed content, IPv4 and IPv6 entry counts.
+HEADER = struct.Struct("<8s32sQQ")
+WIDTHS = {4: 4, 6: 16}  # Bytes per packed network address
+
+def parse_ipv4(value):
+    """Return a bare IPv4 address in canonical dotted-quad form as an int, or None otherwise.
+
+    Single IPv4 hosts make up most of every feed; parsing them with inet_pton instead of
+    building ipaddress objects is what keeps the per-entry paths fast.
+    """
+    if "/" in value or ":" in value:
+        return None
+    try:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET, value), "big")
+    except OSError:
+        return None
+
+def packed_entry(entry):
+    """Return (version, first address as int, prefix length) for a normalized blacklist entry."""
+    address = parse_ipv4(entry)
+    if address is not None:
+        return 4, address, 32
+    network = ipaddress.ip_network(entry, strict=False)
+    return network.version, int(network.network_address), network.prefixlen
+
+def write_snapshot(ip_list, feed_hash, path):
+    """Write the blacklist as a compact binary snapshot, replacing path atomically.
+
+    Entries are stored per family as sorted big-endian network addresses followed by one
+    prefix-length byte per network. Networks nested in a larger one are dropped, so the
+    stored ranges never overlap and a single bisect answers a lookup.
+    """
+    sections = {4: [], 6: []}
+    for entry in ip_list:
+        version, first, prefix = packed_entry(entry)
+        sections[version].append((first, prefix))
+    with atomic_write(path) as f:
+        f.write(HEADER.pack(MAGIC, feed_hash, 0, 0))
+        counts = []
+        for version, width in WIDTHS.items():
+            bits = width * 8
+            keys, prefixes = bytearray(), bytearray()
+            end = -1
+            # Larger networks sort first at a shared start, so nested ones follow their parent.
+            for first, prefix in sorted(sections[version]):
+                if first <= end:
+                    continue
+                end = first + (1 << (bits - prefix)) - 1
+                keys += first.to_bytes(width, "big")
+                prefixes.append(prefix)
+            f.write(keys)
+            f.write(prefixes)
+            counts.append(len(prefixes))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, feed_hash, *counts))
+    print(f"Snapshot written: {counts[0]} IPv4 and {counts[1]} IPv6 networks.")
+
+class PackedKeys:
+    """Sequence view of fixed-width keys in a buffer, for bisect without unpacking."""
+
+    def __init__(self, buffer, offset, width, count):
+        self.buffer = buffer
+        self.offset = offset
+        self.width = width
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        start = self.offset + i * self.width
+        return self.buffer[start:start + self.width]
+
+class Snapshot:
+    """A blacklist snapshot mapped read-only into memory.
+
+    Loading costs one mmap; lookups bisect the packed arrays and diffs walk them,
+    so no Python objects are built for entries that are not asked for.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.feed_hash, count4, count6 = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a blacklist snapshot")
+        self.keys = {}
+        self.prefixes = {}
+        offset = HEADER.size
+        for version, count in ((4, count4), (6, count6)):
+            width = WIDTHS[version]
+            self.keys[version] = PackedKeys(self.buffer, offset, width, count)
+            offset += width * count
+            self.prefixes[version] = PackedKeys(self.buffer, offset, 1, count)
+            offset += count
+
+    def __len__(self):
+        return len(self.keys[4]) + len(self.keys[6])
+
+    def __contains__(self, address):
+        address = ipaddress.ip_address(address)
+        keys = self.keys[address.version]
+        i = bisect_right(keys, address.packed) - 1
+        if i < 0:
+            return False
+        shift = address.max_prefixlen - self.prefixes[address.version][i][0]
+        return int.from_bytes(keys[i], "big") >> shift == int(address) >> shift
+
+    def records(self, version):
+        """Yield (packed address, prefix length byte) pairs in sorted order."""
+        keys, prefixes = self.keys[version], self.prefixes[version]
+        for i in range(len(keys)):
+            yield keys[i], prefixes[i]
+
+    def entries(self):
+        """Yield every network in the snapshot as a string."""
+        for version in WIDTHS:
+            for key, prefix in self.records(version):
+                yield network_string(key, prefix)
+
+    def changes(self, other):
+        """Yield (added, version, key, prefix) for records differing from other, in sorted order.
+
+        added is True for records only in this snapshot and False for those only in other.
+        Both snapshots are walked in a single merge pass.
+        """
+        for version in WIDTHS:
+            mine, theirs = self.records(version), other.records(version)
+            a, b = next(mine, None), next(theirs, None)
+            while a is not None or b is not None:
+                if b is None or (a is not None and a < b):
+                    yield True, version, *a
+                    a = next(mine, None)
+                elif a is None or b < a:
+                    yield False, version, *b
+                    b = next(theirs, None)
+                else:
+                    a, b = next(mine, None), next(theirs, None)
+
+    def diff(self, other):
+        """Return (added, removed) networks going from other to this snapshot."""
+        added, removed = [], []
+        for is_added, _, key, prefix in self.changes(other):
+            (added if is_added else removed).append(network_string(key, prefix))
+        return added, removed
+
+    def close(self):
+        self.buffer.close()
+
+def network_string(key, prefix):
+    """Format a packed address and prefix length byte, as a bare address for single hosts."""
+    address = ipaddress.ip_address(key)
+    if prefix[0] == address.max_prefixlen:
+        return str(address)
+    return f"{address}/{prefix[0]}"
+
+def feed_hash(contents):
+    """Return the SHA-256 digest over the given feed contents (or per-feed digests), in order."""
+    digest = hashlib.sha256()
+    for content in contents:
+        digest.update(content)
+    return digest.digest()
+
+def encode_varint(value, out):
+    """Append value to out as an unsigned LEB128 varint."""
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+def decode_varint(buffer, pos):
+    """Return the varint at pos in buffer and the position after it."""
+    value = shift = 0
+    while True:
+        byte = buffer[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+def encode_delta(feed_hash, changes):
+    """Encode changes from Snapshot.changes as a zlib-compressed delta.
+
+    Per family, the added then the removed records are stored as a count followed by
+    the varint gap from the previous key and the prefix length byte of each record.
+    """
+    groups = {(version, added): [] for version in WIDTHS for added in (True, False)}
+    for added, version, key, prefix in changes:
+        groups[version, added].append((int.from_bytes(key, "big"), prefix[0]))
+    body = bytearray(feed_hash)
+    for records in groups.values():
+        encode_varint(len(records), body)
+        last = 0
+        for value, prefix in sorted(records):
+            encode_varint(value - last, body)
+            body.append(prefix)
+            last = value
+    return zlib.compress(bytes(body))
+
+def decode_delta(data):
+    """Return (feed hash, added, removed) from an encoded delta, the networks as strings."""
+    body = zlib.decompress(data)
+    feed_hash, pos = body[:32], 32
+    added, removed = set(), set()
+    for version, width in WIDTHS.items():
+        for networks in (added, removed):
+            count, pos = decode_varint(body, pos)
+            value = 0
+            for _ in range(count):
+                gap, pos = decode_varint(body, pos)
+                value += gap
+                networks.add(network_string(value.to_bytes(width, "big"), body[pos:pos + 1]))
+                pos += 1
+    return feed_hash, added, removed
+
+def write_delta(feed_hash, changes, path):
+    """Write changes from Snapshot.changes to path as an encoded delta."""
+    with atomic_write(path) as f:
+        f.write(encode_delta(feed_hash, changes))
+
+def read_delta(path):
+    """Return (feed hash, added, removed) from a delta file."""
+    with open(path, "rb") as f:
+        return decode_delta(f.read())
+
+def version_path(version, kind, directory=SNAPSHOT_DIR):
+    """Return the path of a stored version, kind being "snap" (full) or "delta"."""
+    return os.path.join(directory, f"{version:08d}.{kind}")
+
+def snapshot_versions(directory=SNAPSHOT_DIR):
+    """Return the stored version numbers, oldest first."""
+    if not os.path.isdir(directory):
+        return []
+    versions = []
+    for name in os.listdir(directory):
+        stem, kind = os.path.splitext(name)
+        if kind in (".snap", ".delta") and stem.isdigit():
+            versions.append(int(stem))
+    return sorted(versions)
+
+def commit_snapshot(ip_list, feed_hash, directory=SNAPSHOT_DIR, keep=SNAPSHOT_HISTORY):
+    """Store ip_list as the newest snapshot version and return its number.
+
+    The previous newest version is rewritten as a reverse delta against the new one and
+    versions beyond keep are deleted. Nothing is added if the entries did not change.
+    """
+    versions = snapshot_versions(directory)
+    version = versions[-1] + 1 if versions else 1
+    path = version_path(version, "snap", directory)
+    write_snapshot(ip_list, feed_hash, path)
+    if versions:
+        previous_path = version_path(versions[-1], "snap", directory)
+        current, previous = Snapshot(path), Snapshot(previous_path)
+        try:
+            changes = list(previous.changes(current))
+            if not changes and previous.feed_hash == current.feed_hash:
+                os.unlink(path)
+                return versions[-1]
+            write_delta(previous.feed_hash, changes, version_path(versions[-1], "delta", directory))
+        finally:
+            current.close()
+            previous.close()
+        os.unlink(previous_path)
+    for old in versions[:max(0, len(versions) + 1 - keep)]:
+        os.unlink(version_path(old, "delta", directory))
+    print(f"Stored blacklist snapshot version {version}.")
+    return version
+
+def latest_snapshot(directory=SNAPSHOT_DIR):
+    """Map the newest stored version, or return None if there is none."""
+    versions = snapshot_versions(directory)
+    return Snapshot(version_path(versions[-1], "snap", directory)) if versions else None
+
+def restore_entries(version, directory=SNAPSHOT_DIR):
+    """Rebuild the set of networks of a stored version by walking the reverse deltas back."""
+    versions = snapshot_versions(directory)
+    if version not in versions:
+        raise ValueError(f"snapshot version {version} not found, stored: {versions}")
+    latest = latest_snapshot(directory)
+    try:
+        entries = set(latest.entries())
+    finally:
+        latest.close()
+    for older in reversed(versions[:-1]):
+        if older < version:
+            break
+        _, added, removed = read_delta(version_path(older, "delta", directory))
+        entries -= removed
+        entries |= added
+    return entries
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect stored blacklist snapshots.")
+    parser.add_argument("--directory", default=SNAPSHOT_DIR)
+    parser.add_argument("addresses", nargs="*", help="addresses to look up in the newest version")
+    args = parser.parse_args()
+    versions = snapshot_versions(args.directory)
+    for version in versions[:-1]:
+        feed_hash, added, removed = read_delta(version_path(version, "delta", args.directory))
+        print(f"{version}: feed hash {feed_hash.hex()}, +{len(added)}/-{len(removed)} against {version + 1}")
+    snapshot = latest_snapshot(args.directory)
+    if snapshot is None:
+        print("No snapshots stored.")
+        return
+    print(f"{versions[-1]}: feed hash {snapshot.feed_hash.hex()}, {len(snapshot)} networks")
+    for address in args.addresses:
+        print(f"{address}: {'listed' if address in snapshot else 'not listed'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+import os
+import json
+import time
+import heapq
+import random
+import asyncio
+import argparse
+import threading
+import firewall_script
+import firewall_metrics
+import blacklist_snapshot
+
+REFRESH_INTERVAL = 3600  # Seconds between blacklist refreshes
+REFRESH_JITTER = 300  # Random spread so a fleet does not hit the feed at once
+CONTROL_SOCKET = "/run/firewall/control.sock"
+BATCH_WINDOW = 0.001  # Seconds to collect block/unblock requests into one kernel update
+IPSET_TIMEOUT = 60  # Seconds to wait for a queued kernel update before reporting failure
+
+class BanScheduler:
+    """Track temporary bans in a heap ordered by expiry, so expiring costs O(log n) per ban."""
+
+    def __init__(self):
+        self.heap = []  # (expires_at, address), possibly with stale entries
+        self.expiry = {}  # address -> expires_at of its current ban
+
+    def __len__(self):
+        return len(self.expiry)
+
+    def expires_at(self, address):
+        return self.expiry.get(address)
+
+    def add(self, address, ttl):
+        """Ban address for ttl seconds, replacing any earlier ban."""
+        expires_at = time.time() + ttl
+        self.expiry[address] = expires_at
+        heapq.heappush(self.heap, (expires_at, address))
+
+    def remove(self, address):
+        # The heap entry is left behind and skipped once it reaches the top.
+        self.expiry.pop(address, None)
+
+    def next_expiry(self):
+        """Return the time the earliest ban runs out, or None without bans."""
+        while self.heap and self.expiry.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+        return self.heap[0][0] if self.heap else None
+
+    def pop_expired(self, now):
+        """Remove and return the addresses whose bans ran out by now."""
+        expired = []
+        while (expires_at := self.next_expiry()) is not None and expires_at <= now:
+            address = heapq.heappop(self.heap)[1]
+            del self.expiry[address]
+            expired.append(address)
+        return expired
+
+class FirewallDaemon:
+    """Keep the parsed blacklist resident and refresh the kernel set with diffs."""
+
+    def __init__(self, interval=REFRESH_INTERVAL, jitter=REFRESH_JITTER):
+        self.interval = interval
+        self.jitter = jitter
+        self.session = firewall_script.feed_session()  # Reuses connections between refreshes
+        self.feeds = {}  # Validators and parsed entries per feed, for incremental refreshes
+        self.applied_hash = None  # Hash of the feeds and allow-list behind self.blacklist
+        self.blacklist = set()  # Entries from the feeds
+        self.manual = set()  # Entries blocked through the control API
+        self.ipset = firewall_script.IpsetSession()  # Orders every kernel set update
+        # Serializes kernel updates and changes to the two sets above.
+        self.lock = threading.Lock()
+        self.pending = {}  # address -> ("add" | "del" | "ban", ttl, [futures])
+        self.wakeup = None
+        self.bans = BanScheduler()
+        self.bans_changed = None
+        self.kernel_timeouts = False
+        self.stats = {"refreshes": 0, "unchanged_refreshes": 0, "block_requests": 0,
+                      "unblock_requests": 0, "ban_requests": 0, "expired_bans": 0, "batches": 0,
+                      "rollbacks": 0, "last_refresh": None}
+
+    def setup(self):
+        """Install the rate limits and the blacklist sets once at startup.
+
+        The sets are seeded from the latest stored snapshot, so the host keeps enforcing
+        the last known blacklist even while the feeds are unreachable.
+        """
+        firewall_script.refined_rate_limit()
+        self.kernel_timeouts = firewall_script.ensure_blacklist_set()
+        ip_list, feed_hash = firewall_script.stored_blacklist()
+        if ip_list is None:
+            return
+        firewall_script.load_blacklist_sets(ip_list)
+        self.blacklist, self.applied_hash = ip_list, feed_hash
+        print(f"Seeded the blacklist sets with {len(ip_list)} snapshot entries.")
+
+    def apply_entries(self, ip_list, reload=False):
+        """Bring the kernel sets to ip_list plus the manual entries, then record ip_list.
+
+        Runs on the ipset session's worker, after every batch queued before it, so the
+        daemon's view only changes once the kernel update has succeeded.
+        """
+        with self.lock:
+            manual, blacklist = set(self.manual), self.blacklist
+        if reload or firewall_script.needs_reload(ip_list | manual):
+            # The sets must grow or be resharded: rebuild them at the right size.
+            firewall_script.load_blacklist_sets(ip_list | manual)
+        else:
+            # Manually blocked entries stay in the kernel set either way.
+            firewall_script.update_blacklist_set(ip_list - blacklist - manual, blacklist - ip_list - manual)
+        with self.lock:
+            self.blacklist = ip_list
+
+    def refresh(self):
+        """Fetch the feeds that changed and apply only the difference to the kernel set."""
+        # Work on a copy so a failed refresh does not record the new validators.
+        state = {key: dict(value) for key, value in self.feeds.items()}
+        allowlist = firewall_script.load_allowlist()
+        merged = firewall_script.load_blacklist_feeds(session=self.session, state=state, allowlist=allowlist,
+                                                      known_hash=self.applied_hash)
+        self.stats["refreshes"] += 1
+        self.stats["last_refresh"] = time.time()
+        if merged is None:
+            self.stats["unchanged_refreshes"] += 1
+            print("Blacklist unchanged.")
+            return
+        ip_list = firewall_script.subtract_allowlist(set(merged), allowlist)
+        feed_hash = firewall_script.last_feed_hash
+        self.ipset.call(self.apply_entries, ip_list).result(timeout=IPSET_TIMEOUT)
+        self.feeds, self.applied_hash = state, feed_hash
+        firewall_script.persist_blacklist(ip_list, feed_hash)
+
+    def rollback(self, version):
+        """Reload the kernel sets from a stored snapshot version in one ipset restore."""
+        ip_list = blacklist_snapshot.restore_entries(version)
+        self.ipset.call(self.apply_entries, ip_list, True).result(timeout=IPSET_TIMEOUT)
+        self.applied_hash = None
+        self.stats["rollbacks"] += 1
+        return len(ip_list)
+
+    def write_metrics(self):
+        """Export the daemon's state along with fresh kernel counters."""
+        firewall_metrics.blacklist_entries.set(len(self.blacklist))
+        firewall_metrics.collect_kernel_counters()
+        firewall_metrics.write_textfile()
+
+    def next_delay(self):
+        """Seconds until the next refresh, jittered around the interval."""
+        return max(0, self.interval + random.uniform(-self.jitter, self.jitter))
+
+    async def refresh_forever(self):
+        """Refresh the blacklist on schedule, surviving failed refreshes."""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self.refresh)
+            except Exception as e:
+                print(f"Blacklist refresh failed: {e}")
+            try:
+                await loop.run_in_executor(None, self.write_metrics)
+            except OSError as e:
+                print(f"Failed to write metrics: {e}")
+            await asyncio.sleep(self.next_delay())
+
+    def apply_batch(self, batch):
+        """Queue coalesced manual block/unblock/ban requests as one kernel update.
+
+        Returns a Future resolved once the kernel has applied them. The commands are built
+        on the session's worker when the batch runs, so they target the shards left by any
+        reload queued ahead of it, and the manual set only changes once they succeeded.
+        """
+        added = {address for address, (action, _) in batch.items() if action == "add"}
+        banned = {address: ttl for address, (action, ttl) in batch.items() if action == "ban"}
+        unbanned = {address for address, (action, _) in batch.items() if action == "del"}
+
+        def build():
+            with self.lock:
+                # Entries still listed by a feed stay in the kernel set.
+                removed = unbanned - self.blacklist
+            return firewall_script.blacklist_set_commands(added, removed, banned, unbanned)
+
+        def applied():
+            with self.lock:
+                self.manual |= added
+                self.manual -= unbanned
+
+        return self.ipset.submit(build, applied)
+
+    async def complete_batch(self, pending, batch, update):
+        """Wait for a streamed batch to be applied, then answer the requests it contained."""
+        try:
+            with firewall_metrics.apply_seconds.time(stage="session"):
+                await asyncio.wait_for(asyncio.wrap_future(update), IPSET_TIMEOUT)
+            error = None
+        except Exception as e:
+            error = e
+        else:
+            for address, (action, ttl) in batch.items():
+                if action == "ban":
+                    self.bans.add(address, ttl)
+                elif action == "del":
+                    self.bans.remove(address)
+            self.bans_changed.set()
+        for _, _, futures in pending.values():
+            for future in futures:
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+
+    async def flush_forever(self):
+        """Stream queued requests every BATCH_WINDOW seconds while there are any.
+
+        A batch is sent without waiting for the previous one to be acknowledged.
+        """
+        loop = asyncio.get_running_loop()
+        completions = set()  # Keeps the tasks answering in-flight batches referenced
+        while True:
+            await self.wakeup.wait()
+            await asyncio.sleep(BATCH_WINDOW)
+            self.wakeup.clear()
+            pending, self.pending = self.pending, {}
+            batch = {address: (action, ttl) for address, (action, ttl, _) in pending.items()}
+            update = self.apply_batch(batch)
+            self.stats["batches"] += 1
+            task = loop.create_task(self.complete_batch(pending, batch, update))
+            completions.add(task)
+            task.add_done_callback(completions.discard)
+
+    async def expire_forever(self):
+        """Forget bans as they run out; the kernel has already dropped them from its set."""
+        while True:
+            next_expiry = self.bans.next_expiry()
+            timeout = None if next_expiry is None else max(0, next_expiry - time.time())
+            try:
+                await asyncio.wait_for(self.bans_changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self.bans_changed.clear()
+            self.stats["expired_bans"] += len(self.bans.pop_expired(time.time()))
+
+    async def enqueue(self, address, action, ttl=None):
+        """Queue a block/unblock/ban and wait until the kernel update containing it is done."""
+        future = asyncio.get_running_loop().create_future()
+        previous = self.pending.get(address)
+        # The latest request for an address wins within a batch.
+        futures = previous[2] if previous else []
+        futures.append(future)
+        self.pending[address] = (action, ttl, futures)
+        self.wakeup.set()
+        await future
+
+    async def handle_command(self, line):
+        """Execute one control command and return the JSON-serializable reply.
+
+        block takes an optional ban length in seconds; without it the block is permanent.
+        rollback reloads the feed entries of a stored snapshot version.
+        """
+        command, *args = line.split()
+        if command == "stats":
+            return {"ok": True, "feed_entries": len(self.blacklist), "manual_entries": len(self.manual),
+                    "temporary_bans": len(self.bans), "pending": len(self.pending), **self.stats}
+        if command == "rollback" and len(args) == 1:
+            version = int(args[0])
+            entries = await asyncio.get_running_loop().run_in_executor(None, self.rollback, version)
+            return {"ok": True, "version": version, "feed_entries": entries}
+        max_args = 2 if command == "block" else 1
+        if command not in ("block", "unblock", "query") or not 1 <= len(args) <= max_args:
+            return {"ok": False, "error": f"unknown command: {line}"}
+        address = firewall_script.normalize_entry(args[0])
+        if command == "block" and len(args) == 2:
+            ttl = int(args[1])
+            if not 0 < ttl <= firewall_script.MAX_BAN_TTL:
+                raise ValueError(f"ban length must be 1-{firewall_script.MAX_BAN_TTL} seconds")
+            if not self.kernel_timeouts:
+                return {"ok": False, "error": "temporary bans are not supported by this kernel"}
+            self.stats["ban_requests"] += 1
+            await self.enqueue(address, "ban", ttl)
+        elif command == "block":
+            self.stats["block_requests"] += 1
+            await self.enqueue(address, "add")
+        elif command == "unblock":
+            self.stats["unblock_requests"] += 1
+            await self.enqueue(address, "del")
+        return {"ok": True, "address": address, "feed": address in self.blacklist,
+                "manual": address in self.manual, "banned_until": self.bans.expires_at(address)}
+
+    async def handle_client(self, reader, writer):
+        """Serve newline-delimited commands on one control connection."""
+        try:
+            while line := (await reader.readline()).decode().strip():
+                try:
+                    reply = await self.handle_command(line)
+                except ValueError as e:
+                    reply = {"ok": False, "error": str(e)}
+                except (RuntimeError, OSError, TimeoutError, asyncio.TimeoutError) as e:
+                    reply = {"ok": False, "error": f"kernel update failed: {str(e) or 'timed out'}"}
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve_control(self, path):
+        """Serve the block/unblock/query/stats/rollback API on a Unix socket."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.unlink(path)
+        server = await asyncio.start_unix_server(self.handle_client, path=path)
+        os.chmod(path, 0o660)
+        print(f"Control API listening on {path}")
+        async with server:
+            await server.serve_forever()
+
+    async def run(self, control_socket=CONTROL_SOCKET):
+        self.wakeup = asyncio.Event()
+        self.bans_changed = asyncio.Event()
+        await asyncio.get_running_loop().run_in_executor(None, self.setup)
+        await asyncio.gather(self.refresh_forever(), self.flush_forever(), self.expire_forever(),
+                             self.serve_control(control_socket))
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the firewall as a long-lived daemon.")
+    parser.add_argument("--interval", type=float, default=REFRESH_INTERVAL)
+    parser.add_argument("--jitter", type=float, default=REFRESH_JITTER)
+    parser.add_argument("--control-socket", default=CONTROL_SOCKET)
+    parser.add_argument("--raw", action="store_true",
+                        help="drop blacklisted packets in the raw table, before connection tracking")
+    args = parser.parse_args()
+    if args.raw:
+        firewall_script.BLACKLIST_TABLE = "raw"
+    asyncio.run(FirewallDaemon(args.interval, args.jitter).run(args.control_socket))
+
+if __name__ == "__main__":
+    main()
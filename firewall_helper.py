@@ -0,0 +1,211 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import atexit
+import argparse
+import itertools
+import threading
+import subprocess
+import collections
+from concurrent.futures import Future
+
+# Only these programs may be run through the helper, named exactly and looked up on
+# TRUSTED_PATH only. Package installation stays out of it: it would run arbitrary code.
+ALLOWED_COMMANDS = {"iptables", "ip6tables", "iptables-save", "iptables-restore", "ip6tables-save",
+                    "ip6tables-restore", "ipset", "true"}
+TRUSTED_PATH = "/usr/sbin:/usr/bin:/sbin:/bin"
+
+# ipset prints nothing for commands that succeed, so each streamed batch ends with this one,
+# whose single output line acknowledges every command before it.
+IPSET_SENTINEL = "version"
+
+def trusted_command(name):
+    """Return the absolute path of a program found on TRUSTED_PATH, or raise OSError."""
+    path = shutil.which(name, path=TRUSTED_PATH)
+    if path is None:
+        raise FileNotFoundError(f"{name} not found on {TRUSTED_PATH}")
+    return path
+
+def run_command(args, input=None):
+    """Run one allowed command and return its response fields."""
+    if args[0] not in ALLOWED_COMMANDS:
+        return {"returncode": 126, "stdout": "", "stderr": f"{args[0]} is not allowed\n"}
+    try:
+        result = subprocess.run([trusted_command(args[0]), *args[1:]], input=input, capture_output=True,
+                                text=True, env={"PATH": TRUSTED_PATH})
+    except OSError as e:
+        return {"returncode": 127, "stdout": "", "stderr": f"{e}\n"}
+    return {"returncode": result.returncode, "stdout": result.stdout, "stderr": result.stderr}
+
+class IpsetStream:
+    """One interactive ipset process kept open on the root side, fed batches of commands.
+
+    Batches are written as they arrive, without waiting for earlier ones to be acknowledged.
+    stdbuf line-buffers ipset's output, so each sentinel line reaches the reader at once;
+    whatever ipset prints before it, prompts aside, is the errors of that batch.
+    """
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.pending = collections.deque()  # (request id, error lines) of the batches in flight
+        self.process = subprocess.Popen([trusted_command("stdbuf"), "-oL", trusted_command("ipset"), "-exist", "-"],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT, text=True, env={"PATH": TRUSTED_PATH})
+        threading.Thread(target=self.read, daemon=True).start()
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def send(self, request_id, commands):
+        self.pending.append((request_id, []))
+        self.process.stdin.write("\n".join(commands) + f"\n{IPSET_SENTINEL}\n")
+        self.process.stdin.flush()
+
+    def read(self):
+        for line in self.process.stdout:
+            line = re.sub(r"^(\S*ipset> )+", "", line).strip()
+            if not line or not self.pending:
+                continue
+            request_id, errors = self.pending[0]
+            if "protocol version" in line:
+                self.pending.popleft()
+                self.respond({"id": request_id, "returncode": 1 if errors else 0, "stdout": "",
+                              "stderr": "".join(errors)})
+            else:
+                errors.append(line + "\n")
+        while self.pending:
+            request_id, errors = self.pending.popleft()
+            self.respond({"id": request_id, "returncode": 1, "stdout": "",
+                          "stderr": "".join(errors) + "ipset session exited\n"})
+
+def serve():
+    """Run requested commands as root, one JSON request and response per line.
+
+    Requests carrying "ipset" commands are streamed to a shared IpsetStream and answered
+    when ipset acknowledges them, so their responses may follow later requests'.
+    """
+    lock = threading.Lock()
+    stream = None
+
+    def respond(response):
+        with lock:
+            sys.stdout.write(json.dumps(response) + "\n")
+            sys.stdout.flush()
+
+    for line in sys.stdin:
+        request = json.loads(line)
+        if "ipset" in request:
+            try:
+                if stream is None or not stream.alive():
+                    stream = IpsetStream(respond)
+            except OSError as e:
+                respond({"id": request["id"], "returncode": 127, "stdout": "", "stderr": f"{e}\n"})
+                continue
+            stream.send(request["id"], request["ipset"])
+        else:
+            respond({"id": request["id"], **run_command(request["args"], request.get("input"))})
+
+class PrivilegedHelper:
+    """Client for a helper started with sudo once, which then runs every privileged command.
+
+    Requests are tagged with ids and answered through Futures, so streamed ipset batches
+    can be in flight while other requests are sent.
+    """
+
+    def __init__(self):
+        self.process = None
+        self.lock = threading.Lock()  # Serializes writes to the helper and starting it
+        self.pending = {}  # Request id -> Future of the response, for the current process
+        self.ids = itertools.count()
+
+    def start(self):
+        self.process = subprocess.Popen(["sudo", sys.executable, os.path.abspath(__file__), "--serve"],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        self.pending = {}
+        threading.Thread(target=self.read_responses, args=(self.process, self.pending), daemon=True).start()
+        atexit.register(self.close)
+
+    def read_responses(self, process, pending):
+        for line in process.stdout:
+            response = json.loads(line)
+            pending.pop(response["id"]).set_result(response)
+        for request_id in list(pending):
+            pending.pop(request_id).set_exception(RuntimeError("privileged helper exited"))
+
+    def send(self, request):
+        """Send one request and return a Future of its response."""
+        future = Future()
+        with self.lock:
+            if self.process is None or self.process.poll() is not None:
+                self.start()
+            request["id"] = next(self.ids)
+            self.pending[request["id"]] = future
+            self.process.stdin.write(json.dumps(request) + "\n")
+            self.process.stdin.flush()
+        return future
+
+    def stream_ipset(self, commands):
+        """Stream ipset commands to the helper's long-lived ipset process.
+
+        Returns a Future of the response, resolved once ipset has applied every command.
+        """
+        return self.send({"ipset": list(commands)})
+
+    def run(self, args, input=None, capture_output=False, text=False):
+        """Run args as root, returning a CompletedProcess like subprocess.run."""
+        response = self.send({"args": args, "input": input}).result()
+        stdout, stderr = response["stdout"], response["stderr"]
+        if not capture_output:
+            sys.stdout.write(stdout)
+            sys.stderr.write(stderr)
+            stdout = stderr = None
+        elif not text:
+            stdout, stderr = stdout.encode(), stderr.encode()
+        return subprocess.CompletedProcess(args, response["returncode"], stdout, stderr)
+
+    def close(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.stdin.close()
+            self.process.wait()
+
+helper = PrivilegedHelper()
+
+def run_privileged(args, **kwargs):
+    """Run a command as root through the shared helper, started on first use."""
+    return helper.run(args, **kwargs)
+
+def stream_ipset(commands):
+    """Stream ipset commands through the shared helper, returning a Future of the response."""
+    return helper.stream_ipset(commands)
+
+def benchmark(count):
+    """Compare sudo per command against the helper for count trivial commands."""
+    start = time.perf_counter()
+    for _ in range(count):
+        subprocess.run(["sudo", "true"])
+    sudo_seconds = time.perf_counter() - start
+    run_privileged(["true"])  # Start the helper outside the timed loop
+    start = time.perf_counter()
+    for _ in range(count):
+        run_privileged(["true"])
+    helper_seconds = time.perf_counter() - start
+    print(f"sudo per command: {sudo_seconds / count * 1000:.2f} ms")
+    print(f"privileged helper: {helper_seconds / count * 1000:.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Privileged helper for the firewall scripts.")
+    parser.add_argument("--serve", action="store_true", help="serve requests on stdin (run as root)")
+    parser.add_argument("--benchmark", type=int, metavar="COUNT", help="time COUNT commands each way")
+    args = parser.parse_args()
+    if args.serve:
+        serve()
+    elif args.benchmark:
+        benchmark(args.benchmark)
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import re
+import time
+import argparse
+from firewall_helper import run_privileged
+from atomic_file import atomic_write
+from collections import namedtuple
+from contextlib import contextmanager
+
+METRICS_TEXTFILE = "/var/lib/node_exporter/textfile_collector/firewall.prom"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+
+registry = []
+
+RuleCounter = namedtuple("RuleCounter", "chain position rule packets bytes")
+
+def format_labels(labels):
+    """Render a sorted label tuple in Prometheus text format."""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+class Metric:
+    """A named metric holding one value per label set."""
+    kind = "untyped"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}
+        registry.append(self)
+
+    def set(self, value, **labels):
+        """Set the value, e.g. to mirror a counter kept by the kernel."""
+        self.values[tuple(sorted(labels.items()))] = value
+
+    def samples(self):
+        for labels, value in sorted(self.values.items()):
+            yield self.name, labels, value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{format_labels(labels)} {value}")
+        return "\n".join(lines)
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        counts, total, count = self.values.get(key, ([0] * len(self.buckets), 0, 0))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        self.values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with block in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        for labels, (counts, total, count) in sorted(self.values.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                yield f"{self.name}_bucket", labels + (("le", str(bound)),), bucket_count
+            yield f"{self.name}_bucket", labels + (("le", "+Inf"),), count
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+download_bytes = Counter("firewall_download_bytes_total", "Bytes downloaded from blacklist feeds.")
+download_seconds = Histogram("firewall_download_seconds", "Blacklist download latency.")
+parsed_lines = Counter("firewall_parsed_lines_total", "Blacklist lines parsed.")
+invalid_lines = Counter("firewall_invalid_lines_total", "Blacklist lines skipped as invalid.")
+parse_rate = Gauge("firewall_parse_lines_per_second", "Lines parsed per second by the last parse.")
+blacklist_entries = Gauge("firewall_blacklist_entries", "Valid entries in the last parsed blacklist.")
+aggregate_ratio = Gauge("firewall_aggregate_ratio", "Aggregated networks per blacklist entry.")
+apply_seconds = Histogram("firewall_apply_seconds", "Time spent applying rules to the kernel.")
+rule_count = Gauge("firewall_rules", "Rules in the INPUT chain.")
+port_drops = Counter("firewall_port_drop_packets_total", "Packets dropped per destination port, from kernel counters.")
+last_run = Gauge("firewall_last_run_timestamp_seconds", "Unix time the metrics were last written.")
+
+def read_rule_counters(table="filter"):
+    """Read the packet and byte counters of every rule in a table with one iptables-save call."""
+    result = run_privileged(["iptables-save", "-c", "-t", table], capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"Failed to read iptables counters: {result.stderr}")
+        return []
+    return parse_rule_counters(result.stdout)
+
+def parse_rule_counters(text):
+    """Parse `iptables-save -c` output into RuleCounter entries in chain order."""
+    counters = []
+    positions = {}
+    for line in text.splitlines():
+        # Rule lines look like "[packets:bytes] -A CHAIN match... -j TARGET".
+        if not line.startswith("["):
+            continue
+        close = line.index("]")
+        packets, byte_count = line[1:close].split(":")
+        rule = line[close + 2:]
+        chain = rule.split(None, 2)[1]
+        positions[chain] = positions.get(chain, 0) + 1
+        counters.append(RuleCounter(chain, positions[chain], rule, int(packets), int(byte_count)))
+    return counters
+
+def collect_kernel_counters():
+    """Export the INPUT rule count and per-port drop counters from one counter read."""
+    counters = [c for c in read_rule_counters() if c.chain == "INPUT"]
+    rule_count.set(len(counters))
+    drops = {}
+    for counter in counters:
+        port = re.search(r"--dport (\d+)", counter.rule)
+        if port and counter.rule.endswith("-j DROP"):
+            drops[port.group(1)] = drops.get(port.group(1), 0) + counter.packets
+    for port, packets in drops.items():
+        port_drops.set(packets, port=port)
+
+def rule_key(counter, seen):
+    """Identify a rule by chain and text, numbering duplicates so they stay distinct."""
+    base = (counter.chain, counter.rule)
+    seen[base] = seen.get(base, 0) + 1
+    return base + (seen[base],)
+
+def rule_hit_rates(previous, current, interval):
+    """Return (packets per second, counter) for each current rule between two reads.
+
+    Rules that are new, or whose counters were reset, are measured from zero.
+    """
+    before = {}
+    seen = {}
+    for counter in previous:
+        before[rule_key(counter, seen)] = counter.packets
+    rates = []
+    seen = {}
+    for counter in current:
+        delta = counter.packets - before.get(rule_key(counter, seen), 0)
+        if delta < 0:
+            delta = counter.packets
+        rates.append((delta / interval, counter))
+    return rates
+
+def report_hit_rates(rates, top=10):
+    """Print the hottest rules and the rules that matched nothing over the interval."""
+    hot = sorted(rates, key=lambda item: item[0], reverse=True)[:top]
+    print(f"Hottest {len(hot)} rules (packets/s):")
+    for rate, counter in hot:
+        print(f"  {rate:12.2f}  {counter.chain}#{counter.position}: {counter.rule}")
+    dead = [counter for rate, counter in rates if rate == 0]
+    print(f"{len(dead)} of {len(rates)} rules matched no packets.")
+
+def watch_rule_counters(interval, samples=None, table="filter"):
+    """Sample rule counters every interval seconds and report per-rule hit rates."""
+    previous = read_rule_counters(table)
+    taken = 0
+    while samples is None or taken < samples:
+        time.sleep(interval)
+        current = read_rule_counters(table)
+        report_hit_rates(rule_hit_rates(previous, current, interval))
+        previous = current
+        taken += 1
+
+def write_textfile(path=METRICS_TEXTFILE):
+    """Write all metrics for the node-exporter textfile collector, replacing the file atomically."""
+    last_run.set(time.time())
+    text = "\n".join(metric.render() for metric in registry) + "\n"
+    with atomic_write(path, "w") as f:
+        f.write(text)
+
+def main():
+    parser = argparse.ArgumentParser(description="Report per-rule iptables hit rates over time.")
+    parser.add_argument("--interval", type=float, default=60)
+    parser.add_argument("--samples", type=int)
+    parser.add_argument("--table", default="filter")
+    args = parser.parse_args()
+    watch_rule_counters(args.interval, args.samples, args.table)
+
+if __name__ == "__main__":
+    main()
@@ -1,115 +1,951 @@
 import os
+import io
+import csv
+import gzip
+import json
+import zlib
+import sqlite3
 import subprocess
 import requests
 import zipfile
 import ipaddress
+import time
+import argparse
+import datetime
+import firewall_metrics
+import blacklist_snapshot
+import blacklist_history
+from firewall_helper import run_privileged, stream_ipset
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, wait
 
 BLACKLIST_URL = "https://myip.ms/files/blacklist/general/full_blacklist_database.zip"
-BLACKLIST_ZIP_PATH = "/tmp/full_blacklist_database.zip"
-BLACKLIST_TXT_PATH = "/tmp/full_blacklist_database.txt"
+BLACKLIST_MEMBER = "full_blacklist_database.txt"  # The only archive member ever read
+BLACKLIST_MAX_BYTES = 512 << 20  # Refuse zip members and gzip feeds inflating past this size
+BLACKLIST_MAX_RATIO = 100  # Refuse feeds compressed more than this, as bombs
+UNZIP_CHUNK = 1 << 20  # Bytes decompressed at a time
+# Only apply myip.ms entries listed within this many days, or from these countries (None for all).
+BLACKLIST_MAX_AGE_DAYS = None
+BLACKLIST_COUNTRIES = None
+# Blacklist feeds merged by the one-shot run. format is one of zip, gzip, text, cidr, csv or
+# json; when an entry appears in several feeds the one with the highest priority tags it.
+# Feeds with "records": "myip.ms" are parsed with their metadata and filtered by age and country.
+BLACKLIST_FEEDS = [
+    {"url": BLACKLIST_URL, "format": "zip", "member": BLACKLIST_MEMBER,
+     "priority": 10, "tag": "myip.ms", "records": "myip.ms",
+     "max_age_days": BLACKLIST_MAX_AGE_DAYS, "countries": BLACKLIST_COUNTRIES},
+]
+FEED_WORKERS = 8
+# Ranges that must never be blocked, whatever the feeds say (office, health checks, CDN egress).
+ALLOWLIST = ["127.0.0.0/8"]
+ALLOWLIST_PATH = "/etc/firewall/allowlist.txt"  # Optional extra allow-list, one CIDR per line
+# "filter" drops blacklisted packets in INPUT; "raw" drops them in PREROUTING, before
+# connection tracking and filter-table traversal, so floods cannot fill the conntrack table.
+BLACKLIST_TABLE = "filter"
+BLACKLIST_CHAIN = "BLACKLIST"  # Chain owning the per-entry DROP rules, jumped to from the hook
+# list:set of blacklist shards (BLACKLIST_SET_0, _1, ...) for incremental updates
+BLACKLIST_SET = "blacklist"
+TEMP_BAN_SET = "blacklist_temp"  # ipset whose entries the kernel expires on their own
+BLACKLIST_SET6 = "blacklist6"  # IPv6 counterparts of the two sets above
+TEMP_BAN_SET6 = "blacklist6_temp"
+# Per address family: iptables command, ipset family, blacklist set, temporary ban set.
+FAMILIES = {4: ("iptables", "inet", BLACKLIST_SET, TEMP_BAN_SET),
+            6: ("ip6tables", "inet6", BLACKLIST_SET6, TEMP_BAN_SET6)}
+MAX_BAN_TTL = 2147483  # Longest timeout ipset accepts, in seconds
+IPSET_SHARD_SIZE = 1 << 20  # Entries per hash:net shard before splitting into more shards
+IPSET_MAX_SHARDS = 64
+IPSET_HEADROOM = 1.25  # Spare capacity for entries added between full reloads
+TEMP_BAN_CAPACITY = 1 << 20  # Temporary bans each family's timeout set can hold at once
+SECURITY_GROUP_ID = "sg-0bc74359cce8c747a"  # Replace with your Security Group ID
+INGRESS_PORTS = [80, 443, 22]
+INGRESS_CIDR = "0.0.0.0/0"
+NETWORK_ACL_IDS = []  # VPC network ACLs that should deny the top blacklist prefixes
+NACL_RULE_LIMIT = 20  # Inbound rules per network ACL and address family (AWS default quota)
+NACL_DENY_RULE_BASE = 1  # First rule number reserved for blacklist deny entries
+SECURITY_GROUP_WORKERS = 16
+SECURITY_GROUP_FILTER_LIMIT = 200  # Maximum values in one describe filter
+
+# (shards, hashsize, maxelem) of the blacklist sets currently loaded, per IP version.
+blacklist_layouts = {}
+
+# SHA-256 over the raw content of the feeds last loaded, recorded in the snapshot header.
+last_feed_hash = None
 
 def install_dependencies():
-    """Install required packages for iptables and requests."""
+    """Install required packages for iptables and requests.
+
+    Uses sudo directly: package installation runs arbitrary code, so the privileged
+    helper does not allow it. Only done when asked for with --install-dependencies.
+    """
     print("Installing dependencies...")
-    subprocess.run(["sudo", "yum", "-y", "install", "iptables-services", "httpd"])
-    subprocess.run(["sudo", "pip3", "install", "requests"])
-
-def download_blacklist():
-    """Download the latest IP blacklist zip file."""
-    print("Downloading IP blacklist...")
-    response = requests.get(BLACKLIST_URL)
-    with open(BLACKLIST_ZIP_PATH, "wb") as f:
-        f.write(response.content)
-    print("Blacklist downloaded.")
-
-def unzip_blacklist():
-    """Unzip the blacklist and extract the IP list."""
-    print("Unzipping IP blacklist...")
-    with zipfile.ZipFile(BLACKLIST_ZIP_PATH, 'r') as zip_ref:
-        zip_ref.extractall("/tmp/")
-    print("Blacklist unzipped.")
-
-def parse_blacklist():
-    """Parse the blacklist file and extract valid IPs."""
-    valid_ips = set()
-    with open(BLACKLIST_TXT_PATH, "r") as f:
-        for line in f:
-            line = line.strip()
-            if line and not line.startswith("#"):
-                # Extract IP part before any comment
-                ip = line.split("#")[0].strip()
-                try:
-                    ipaddress.ip_address(ip)  # Validate if it's a valid IP address
-                    valid_ips.add(ip)
-                except ValueError:
-                    print(f"Invalid IP skipped: {ip}")
-    print(f"{len(valid_ips)} valid IPs parsed from the blacklist.")
-    return valid_ips
-
-def block_ip(ip):
-    """Block a single IP using iptables."""
-    result = subprocess.run(["sudo", "iptables", "-A", "INPUT", "-s", ip, "-j", "DROP"], capture_output=True, text=True)
-    if result.returncode != 0:
-        print(f"Failed to block IP {ip}: {result.stderr}")
+    subprocess.run(["sudo", "yum", "-y", "install", "iptables-services", "ipset", "httpd"])
+    subprocess.run(["sudo", "pip3", "install", "requests", "boto3"])
+
+def copy_limited(source, out, limit, name):
+    """Stream a decompressing source into out, raising ValueError once it passes limit bytes."""
+    written = 0
+    while chunk := source.read(UNZIP_CHUNK):
+        written += len(chunk)
+        if written > limit:
+            raise ValueError(f"{name} inflated past {limit} bytes")
+        out.write(chunk)
+    return written
+
+def copy_zip_member(zip_ref, member, out):
+    """Stream one archive member into out, enforcing the size and compression ratio limits.
+
+    Raises ValueError if the member is missing or too large, checking the declared sizes
+    first and the bytes actually produced while streaming, since headers can lie.
+    """
+    try:
+        info = zip_ref.getinfo(member)
+    except KeyError:
+        raise ValueError(f"archive has no {member}") from None
+    limit = min(BLACKLIST_MAX_BYTES, max(info.compress_size, 1) * BLACKLIST_MAX_RATIO)
+    if info.file_size > limit:
+        raise ValueError(f"{member} would inflate to {info.file_size} bytes, limit is {limit}")
+    with zip_ref.open(info) as source:
+        return copy_limited(source, out, limit, member)
+
+def copy_gzip(content, out, name):
+    """Stream gzip-compressed content into out, enforcing the size and compression ratio limits."""
+    limit = min(BLACKLIST_MAX_BYTES, max(len(content), 1) * BLACKLIST_MAX_RATIO)
+    with gzip.GzipFile(fileobj=io.BytesIO(content)) as source:
+        return copy_limited(source, out, limit, name)
+
+class BlacklistTable:
+    """myip.ms blacklist records stored column by column.
+
+    Listing dates are days since the epoch in an array; countries and reasons repeat a
+    lot, so they are dictionary-encoded into arrays of codes with one name list each.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.hostnames = []
+        self.listed = array("i")  # Days since the epoch, -1 if unknown
+        self.countries = array("I")
+        self.reasons = array("I")
+        self.country_names = []
+        self.reason_names = []
+        self.country_codes = {}  # Name -> code, the inverse of country_names
+        self.reason_codes = {}
+        self.days = {}  # Date string -> days since the epoch
+
+    def __len__(self):
+        return len(self.entries)
+
+    def encode(self, codes, names, name):
+        """Return the code of name in a dictionary column, adding it if new."""
+        code = codes.get(name)
+        if code is None:
+            code = codes[name] = len(names)
+            names.append(name)
+        return code
+
+    def day(self, date):
+        """Return days since the epoch for an ISO date string, or -1 if it does not parse."""
+        day = self.days.get(date)
+        if day is None:
+            try:
+                day = (datetime.date.fromisoformat(date) - datetime.date(1970, 1, 1)).days
+            except ValueError:
+                day = -1
+            self.days[date] = day
+        return day
+
+    def append(self, entry, date="", hostname="", country="", reason=""):
+        self.entries.append(entry)
+        self.hostnames.append(hostname)
+        self.listed.append(self.day(date))
+        self.countries.append(self.encode(self.country_codes, self.country_names, country))
+        self.reasons.append(self.encode(self.reason_codes, self.reason_names, reason))
+
+    def filter(self, max_age_days=None, countries=None):
+        """Return the entries listed within max_age_days and from one of countries.
+
+        Either limit may be None to disable it. Entries with an unknown date are kept.
+        """
+        if max_age_days is None and countries is None:
+            return list(self.entries)
+        cutoff = -1
+        if max_age_days is not None:
+            cutoff = (datetime.date.today() - datetime.date(1970, 1, 1)).days - max_age_days
+        if countries is None:
+            codes = range(len(self.country_names))
+        else:
+            codes = {self.country_codes[name] for name in countries if name in self.country_codes}
+        return [entry for entry, listed, country in zip(self.entries, self.listed, self.countries)
+                if (listed >= cutoff or listed < 0) and country in codes]
+
+def parse_blacklist_records(lines):
+    """Parse myip.ms lines ("ip # date, hostname, country, reason") into a BlacklistTable.
+
+    Returns the table and the number of invalid addresses skipped.
+    """
+    table = BlacklistTable()
+    invalid = 0
+    for line in lines:
+        entry, _, metadata = line.partition("#")
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            entry = normalize_entry(entry)
+        except ValueError:
+            invalid += 1
+            continue
+        fields = [field.strip() for field in metadata.split(",")]
+        if len(fields) >= 4:
+            # Country names may themselves contain commas.
+            table.append(entry, fields[0], fields[1], ", ".join(fields[2:-1]), fields[-1])
+        else:
+            table.append(entry, *fields[:3])
+    return table, invalid
+
+def normalize_entry(value):
+    """Return an address or CIDR in canonical form, as a bare address for single hosts."""
+    value = value.strip()
+    if blacklist_snapshot.parse_ipv4(value) is not None:
+        return value  # inet_pton only accepts canonical dotted quads
+    network = ipaddress.ip_network(value, strict=False)
+    if network.prefixlen == network.max_prefixlen:
+        return str(network.network_address)
+    return str(network)
+
+def feed_session():
+    """Return a requests session pooling enough connections to fetch every feed at once."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=FEED_WORKERS, pool_maxsize=FEED_WORKERS)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def download_feed(session, feed, validators=None):
+    """Download one blacklist feed and return (raw content, validators of the response).
+
+    Given the validators (ETag / Last-Modified) of an earlier response, the request is
+    conditional and the content is None when the feed did not change.
+    """
+    headers = {}
+    if validators and validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators and validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    with firewall_metrics.download_seconds.time(feed=feed["tag"]):
+        response = session.get(feed["url"], headers=headers)
+    if response.status_code == 304:
+        return None, validators
+    response.raise_for_status()
+    firewall_metrics.download_bytes.inc(len(response.content), feed=feed["tag"])
+    return response.content, {"etag": response.headers.get("ETag"),
+                              "last_modified": response.headers.get("Last-Modified")}
+
+def feed_text(feed, content):
+    """Unwrap a feed's zip or gzip container and return (inner format, decoded text)."""
+    feed_format = feed["format"]
+    if feed_format == "zip":
+        with zipfile.ZipFile(io.BytesIO(content)) as zip_ref:
+            out = io.BytesIO()
+            copy_zip_member(zip_ref, feed["member"], out)
+            content = out.getvalue()
+        feed_format = "text"
+    elif feed_format == "gzip":
+        out = io.BytesIO()
+        copy_gzip(content, out, feed["tag"])
+        content = out.getvalue()
+        feed_format = feed.get("inner_format", "text")
+    return feed_format, content.decode("utf-8", errors="replace")
+
+def feed_values(feed, feed_format, text):
+    """Yield the candidate address strings contained in a feed's decoded text."""
+    if feed_format == "json":
+        for item in json.loads(text):
+            yield item if isinstance(item, str) else item[feed.get("key", "ip")]
+    elif feed_format == "csv":
+        column = feed.get("column", 0)
+        for row in csv.reader(io.StringIO(text)):
+            if len(row) > column and not row[0].startswith("#"):
+                yield row[column]
+    else:
+        # Plain text and CIDR lists: first token of each line, comments dropped.
+        for line in text.splitlines():
+            value = line.split("#")[0].split(";")[0].strip()
+            if value:
+                yield value.split()[0]
+
+def parse_feed(feed, content):
+    """Parse one feed into normalized entries, skipping invalid values.
+
+    Returns (entries, invalid count, line count).
+    """
+    feed_format, text = feed_text(feed, content)
+    lines = text.count("\n") + (bool(text) and not text.endswith("\n"))
+    if feed.get("records") == "myip.ms":
+        table, invalid = parse_blacklist_records(text.splitlines())
+        return table.filter(feed.get("max_age_days"), feed.get("countries")), invalid, lines
+    entries = []
+    invalid = 0
+    for value in feed_values(feed, feed_format, text):
+        try:
+            entries.append(normalize_entry(value))
+        except ValueError:
+            invalid += 1
+    return entries, invalid, lines
+
+def load_blacklist_feeds(feeds=BLACKLIST_FEEDS, session=None, state=None, allowlist=(), known_hash=None):
+    """Download feeds concurrently, parse them in parallel and merge them.
+
+    Returns a dict mapping each entry to the tag of the highest-priority feed listing it.
+    state is a dict the caller keeps between calls to refresh incrementally: feeds are then
+    fetched with conditional GETs, unchanged feeds reuse their parsed entries, and None is
+    returned when no feed changed.
+
+    last_feed_hash is set over the feed contents and allowlist, which together decide the
+    compiled blacklist. When it equals known_hash, the hash of the blacklist already stored
+    or applied, the feeds are not parsed and None is returned as well.
+    """
+    global last_feed_hash
+    print(f"Loading {len(feeds)} blacklist feeds...")
+    session = session or feed_session()
+    validators = state.setdefault("validators", {}) if state is not None else {}
+    parsed = state.setdefault("parsed", {}) if state is not None else {}
+    with ThreadPoolExecutor(max_workers=FEED_WORKERS) as pool:
+        downloads = list(pool.map(lambda feed: download_feed(session, feed, validators.get(feed["tag"])), feeds))
+    changed = [(feed, content) for feed, (content, _) in zip(feeds, downloads) if content is not None]
+    if state is not None and not changed:
+        return None
+    digests = {feed["tag"]: blacklist_snapshot.feed_hash([content]) for feed, content in changed}
+    last_feed_hash = blacklist_snapshot.feed_hash(
+        [digests.get(feed["tag"]) or parsed[feed["tag"]][0] for feed in feeds] + ["\n".join(allowlist).encode()])
+    if last_feed_hash == known_hash:
+        print("Blacklist feeds and allow-list unchanged, not parsed.")
+        return None
+
+    start = time.perf_counter()
+    if len(changed) > 1:
+        with ProcessPoolExecutor() as pool:
+            results = list(pool.map(parse_feed, *zip(*changed)))
     else:
-        print(f"Blocked IP: {ip}")
+        results = [parse_feed(feed, content) for feed, content in changed]
+    elapsed = time.perf_counter() - start
+    lines = sum(result[2] for result in results)
+    firewall_metrics.parsed_lines.inc(lines)
+    firewall_metrics.invalid_lines.inc(sum(result[1] for result in results))
+    firewall_metrics.parse_rate.set(lines / elapsed if elapsed else 0)
+    # Only remember the new validators once their feeds parsed, so a failure is retried.
+    for (feed, _), (entries, invalid, _) in zip(changed, results):
+        parsed[feed["tag"]] = (digests[feed["tag"]], entries, invalid)
+    for feed, (_, feed_validators) in zip(feeds, downloads):
+        validators[feed["tag"]] = feed_validators
+
+    merged = {}
+    # Lowest priority first, so higher-priority feeds overwrite the tags they share.
+    for feed in sorted(feeds, key=lambda feed: feed["priority"]):
+        _, entries, invalid = parsed[feed["tag"]]
+        print(f"{feed['tag']}: {len(entries)} entries, {invalid} invalid.")
+        for entry in entries:
+            merged[entry] = feed["tag"]
+    firewall_metrics.blacklist_entries.set(len(merged))
+    print(f"{len(merged)} unique entries merged from {len(feeds)} feeds.")
+    return merged
+
+def load_allowlist():
+    """Return ALLOWLIST plus the entries of ALLOWLIST_PATH, if that file exists."""
+    allowlist = list(ALLOWLIST)
+    if os.path.exists(ALLOWLIST_PATH):
+        with open(ALLOWLIST_PATH) as f:
+            allowlist += [line.split("#")[0].strip() for line in f if line.split("#")[0].strip()]
+    return allowlist
+
+def merged_intervals(networks):
+    """Sort networks into merged, non-overlapping [first, last] integer intervals."""
+    merged = []
+    for first, last in sorted((int(n.network_address), int(n.broadcast_address)) for n in networks):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], last)
+        else:
+            merged.append([first, last])
+    return merged
+
+def entry_interval(entry):
+    """Return (version, first, last) integer bounds of a normalized blacklist entry."""
+    version, first, prefix = blacklist_snapshot.packed_entry(entry)
+    return version, first, first + (1 << (blacklist_snapshot.WIDTHS[version] * 8 - prefix)) - 1
+
+def subtract_allowlist(ip_list, allowlist):
+    """Remove allow-listed ranges from the blacklist using a sorted-interval difference.
+
+    Blacklist entries partly covered by the allow-list are split into the CIDRs that
+    remain. Returns the same kind of collection as given: a set, or a dict keeping tags.
+    Runs in O(n log n) for n blacklist and allow-list entries combined.
+    """
+    tags = ip_list if isinstance(ip_list, dict) else dict.fromkeys(ip_list)
+    allowed = [ipaddress.ip_network(entry, strict=False) for entry in allowlist]
+    by_version = {4: [], 6: []}
+    for entry in tags:
+        version, first, last = entry_interval(entry)
+        by_version[version].append((first, last, entry))
+    result = {}
+    excluded = 0
+    for version, address_class in ((4, ipaddress.IPv4Address), (6, ipaddress.IPv6Address)):
+        allow = merged_intervals(n for n in allowed if n.version == version)
+        entries = sorted(by_version[version])
+        start = 0
+        for first, last, entry in entries:
+            # Entries are sorted by first address, so allow intervals ending earlier never matter again.
+            while start < len(allow) and allow[start][1] < first:
+                start += 1
+            if start == len(allow) or allow[start][0] > last:
+                result[entry] = tags[entry]
+                continue
+            excluded += 1
+            cursor = first
+            i = start
+            # Walk the overlapping allow intervals in place rather than slicing a copy.
+            while i < len(allow) and allow[i][0] <= last:
+                allow_first, allow_last = allow[i]
+                if allow_first > cursor:
+                    for network in ipaddress.summarize_address_range(address_class(cursor), address_class(allow_first - 1)):
+                        result[normalize_entry(str(network))] = tags[entry]
+                cursor = max(cursor, allow_last + 1)
+                i += 1
+            if cursor <= last:
+                for network in ipaddress.summarize_address_range(address_class(cursor), address_class(last)):
+                    result[normalize_entry(str(network))] = tags[entry]
+    if excluded:
+        print(f"{excluded} blacklist entries overlapped the allow-list and were trimmed.")
+    return result if isinstance(ip_list, dict) else set(result)
+
+def aggregate_blacklist(ip_list):
+    """Collapse the blacklist into the smallest list of covering networks per family."""
+    networks = [ipaddress.ip_network(ip) for ip in ip_list]
+    aggregated = (list(ipaddress.collapse_addresses(n for n in networks if n.version == 4)) +
+                  list(ipaddress.collapse_addresses(n for n in networks if n.version == 6)))
+    firewall_metrics.aggregate_ratio.set(len(aggregated) / len(networks) if networks else 1)
+    return aggregated
+
+def rank_prefixes(networks, limit):
+    """Pick the networks covering the most blacklisted addresses, largest first."""
+    return sorted(networks, key=lambda n: (-n.num_addresses, n))[:max(limit, 0)]
+
+def blacklist_hook():
+    """Return the (table, chain) in which blacklist DROP rules are installed."""
+    return ("raw", "PREROUTING") if BLACKLIST_TABLE == "raw" else ("filter", "INPUT")
+
+def entry_version(entry):
+    """Return the IP version of a normalized blacklist entry."""
+    return 6 if ":" in entry else 4
+
+def split_by_family(ip_list):
+    """Split blacklist entries into {4: [...], 6: [...]} by address family."""
+    families = {4: [], 6: []}
+    for ip in ip_list:
+        families[entry_version(ip)].append(ip)
+    return families
+
+def blacklist_layout(count):
+    """Pick (shards, hashsize, maxelem) so count entries load without rehashing.
+
+    The hash table starts with a bucket per expected entry, and lists too large for one
+    set are split into shards of at most IPSET_SHARD_SIZE entries.
+    """
+    shards = min(IPSET_MAX_SHARDS, max(1, -(-count // IPSET_SHARD_SIZE)))
+    per_shard = -(-count // shards)
+    hashsize = 1024
+    while hashsize < per_shard:
+        hashsize *= 2
+    return shards, hashsize, max(65536, int(per_shard * IPSET_HEADROOM))
+
+def shard_set(version, ip):
+    """Return the name of the blacklist shard holding an entry."""
+    shards = blacklist_layouts[version][0]
+    return f"{FAMILIES[version][2]}_{zlib.crc32(ip.encode()) % shards}"
+
+def needs_reload(ip_list):
+    """Return True if the loaded sets are too small, or sharded differently, for ip_list."""
+    for version, entries in split_by_family(ip_list).items():
+        shards, hashsize, maxelem = blacklist_layout(len(entries))
+        loaded_shards, loaded_hashsize, loaded_maxelem = blacklist_layouts[version]
+        if shards != loaded_shards or hashsize > loaded_hashsize or maxelem > loaded_maxelem:
+            return True
+    return False
+
+def load_blacklist_sets(ip_list):
+    """Rebuild the blacklist shards sized for ip_list in a single ipset restore call.
+
+    Each shard is filled under a staging name and swapped in atomically, so the
+    kernel never rehashes while loading and matching never sees a half-filled set.
+    Raises RuntimeError if ipset rejects the update.
+    """
+    commands = []
+    layouts = {}
+    for version, entries in split_by_family(ip_list).items():
+        _, family, name, _ = FAMILIES[version]
+        layouts[version] = shards, hashsize, maxelem = blacklist_layout(len(entries))
+        old_shards = blacklist_layouts[version][0]
+        buckets = [[] for _ in range(shards)]
+        for ip in entries:
+            buckets[zlib.crc32(ip.encode()) % shards].append(ip)
+        for i, bucket in enumerate(buckets):
+            live, staging = f"{name}_{i}", f"{name}_{i}_new"
+            commands.append(f"create {staging} hash:net family {family} hashsize {hashsize} maxelem {maxelem}")
+            commands += [f"add {staging} {ip}" for ip in bucket]
+            if i < old_shards:
+                commands += [f"swap {staging} {live}", f"destroy {staging}"]
+            else:
+                commands += [f"rename {staging} {live}", f"add {name} {live}"]
+        for i in range(shards, old_shards):
+            commands += [f"del {name} {name}_{i}", f"destroy {name}_{i}"]
+    with firewall_metrics.apply_seconds.time(stage="load"):
+        result = run_privileged(["ipset", "-exist", "restore"], input="\n".join(commands) + "\n",
+                                capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to load blacklist sets: {result.stderr.strip()}")
+    blacklist_layouts.update(layouts)
+    for version, (shards, hashsize, maxelem) in layouts.items():
+        print(f"Loaded IPv{version} blacklist into {shards} sets (hashsize {hashsize}, maxelem {maxelem}).")
+
+def ensure_blacklist_set():
+    """Create empty blacklist ipsets for both families and the rules dropping their members.
+
+    Returns False if the kernel does not support the timeout sets for temporary bans.
+    """
+    timeouts = True
+    table, chain = blacklist_hook()
+    existing = run_privileged(["ipset", "list", "-n"], capture_output=True, text=True).stdout.split()
+    for version, (command, family, blacklist_set, temp_set) in FAMILIES.items():
+        # Start with one default-sized shard; load_blacklist_sets resizes as needed.
+        shards, hashsize, maxelem = blacklist_layouts[version] = blacklist_layout(0)
+        run_privileged(["ipset", "-exist", "create", blacklist_set, "list:set", "size", str(IPSET_MAX_SHARDS)])
+        run_privileged(["ipset", "flush", blacklist_set])
+        # Shards and staging sets left by an earlier run would block the next reload's renames.
+        for name in existing:
+            suffix = name[len(blacklist_set) + 1:].removesuffix("_new")
+            if name.startswith(f"{blacklist_set}_") and suffix.isdigit() and name != f"{blacklist_set}_0":
+                run_privileged(["ipset", "destroy", name])
+        run_privileged(["ipset", "-exist", "create", f"{blacklist_set}_0", "hash:net", "family", family,
+                        "hashsize", str(hashsize), "maxelem", str(maxelem)])
+        run_privileged(["ipset", "flush", f"{blacklist_set}_0"])
+        run_privileged(["ipset", "add", blacklist_set, f"{blacklist_set}_0"])
+        sets = [blacklist_set]
+        _, temp_hashsize, temp_maxelem = blacklist_layout(TEMP_BAN_CAPACITY)
+        # A set left by an earlier run may be sized differently: swap in an empty, resized one.
+        staging = f"{temp_set}_new" if temp_set in existing else temp_set
+        run_privileged(["ipset", "destroy", f"{temp_set}_new"], capture_output=True)
+        result = run_privileged(["ipset", "-exist", "create", staging, "hash:net", "family", family,
+                                 "hashsize", str(temp_hashsize), "maxelem", str(temp_maxelem),
+                                 "timeout", "0"], capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"Temporary bans unavailable: {result.stderr}")
+            timeouts = False
+        else:
+            if staging != temp_set:
+                run_privileged(["ipset", "swap", staging, temp_set])
+                run_privileged(["ipset", "destroy", staging])
+            sets.append(temp_set)
+        for name in sets:
+            match = ["-m", "set", "--match-set", name, "src", "-j", "DROP"]
+            if run_privileged([command, "-t", table, "-C", chain, *match], capture_output=True).returncode != 0:
+                result = run_privileged([command, "-t", table, "-I", chain, *match], capture_output=True, text=True)
+                if result.returncode != 0:
+                    print(f"Failed to install the {name} DROP rule: {result.stderr}")
+    return timeouts
+
+def blacklist_set_commands(added=(), removed=(), banned=None, unbanned=()):
+    """Build the ipset commands for a blacklist change.
+
+    Entries go to the IPv4 or IPv6 sets by family. banned maps entries to a ban length
+    in seconds; the kernel drops them from the temporary ban sets once it runs out, so
+    no expiry pass is needed on our side.
+    """
+    banned = banned or {}
+    commands = [f"del {shard_set(entry_version(ip), ip)} {ip}" for ip in removed]
+    commands += [f"del {FAMILIES[entry_version(ip)][3]} {ip}" for ip in unbanned]
+    commands += [f"add {shard_set(entry_version(ip), ip)} {ip}" for ip in added]
+    commands += [f"add {FAMILIES[entry_version(ip)][3]} {ip} timeout {ttl}" for ip, ttl in banned.items()]
+    return commands
+
+def update_blacklist_set(added=(), removed=(), banned=None, unbanned=()):
+    """Apply blacklist changes to the ipsets with a single ipset restore call.
+
+    Raises RuntimeError if ipset rejects the update.
+    """
+    banned = banned or {}
+    commands = blacklist_set_commands(added, removed, banned, unbanned)
+    if not commands:
+        return
+    with firewall_metrics.apply_seconds.time(stage="update"):
+        result = run_privileged(["ipset", "-exist", "restore"], input="\n".join(commands) + "\n",
+                                capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to update blacklist set: {result.stderr.strip()}")
+    print(f"Blacklist set updated: {len(added)} added, {len(removed)} removed, "
+          f"{len(banned)} banned, {len(unbanned)} unbanned.")
+
+class IpsetSession:
+    """Streams ipset changes to the helper's long-lived ipset process, in submission order.
+
+    Batches are written as soon as they are submitted, without waiting for the ones ahead
+    of them to be acknowledged, so a ban costs one pipe round trip rather than a process
+    start. Other kernel updates queued with call, such as set reloads, run on one worker
+    thread once every batch ahead of them has been acknowledged.
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.last = None  # Future of the newest streamed batch
+
+    def stream(self, build, applied, result):
+        def acknowledged(response):
+            try:
+                response = response.result()
+                if response["returncode"] != 0:
+                    raise RuntimeError(f"ipset session failed: {response['stderr'].strip()}")
+                if applied is not None:
+                    applied()
+            except Exception as e:
+                result.set_exception(e)
+            else:
+                result.set_result(None)
+
+        try:
+            commands = build()
+            if commands:
+                stream_ipset(commands).add_done_callback(acknowledged)
+                return
+            if applied is not None:
+                applied()
+        except Exception as e:
+            result.set_exception(e)
+        else:
+            result.set_result(None)
+
+    def submit(self, build, applied=None):
+        """Queue a batch for the ipset session and return a Future resolved once applied.
+
+        build is called on the worker when the batch's turn comes and returns its commands,
+        so they see the set layout left by any reload queued ahead of it. applied, if given,
+        is called once the kernel has accepted the commands and before the Future resolves,
+        so updates queued after it already see its effect.
+        """
+        result = Future()
+        self.last = result
+        self.executor.submit(self.stream, build, applied, result)
+        return result
+
+    def call(self, function, *args):
+        """Queue another kernel update, such as a set reload, behind the pending batches."""
+        last = self.last
+
+        def run():
+            if last is not None:
+                wait([last])
+            return function(*args)
+
+        return self.executor.submit(run)
+
+    def close(self):
+        self.executor.shutdown()
+
+def record_history(ip_list, feed_hash):
+    """Add today's blacklist to the history store."""
+    history = blacklist_history.BlacklistHistory()
+    try:
+        history.record(ip_list, feed_hash)
+    finally:
+        history.close()
+
+def persist_blacklist(ip_list, feed_hash):
+    """Store an applied blacklist as a snapshot version and in the history.
+
+    Called once the blacklist is enforced; failing to store it (an unwritable state
+    directory, a full disk) is reported without undoing the enforcement.
+    """
+    try:
+        blacklist_snapshot.commit_snapshot(ip_list, feed_hash)
+        record_history(ip_list, feed_hash)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Failed to store the blacklist snapshot and history: {e}")
+
+def stored_blacklist():
+    """Return (entries, hash) of the latest stored snapshot, or (None, None) without one."""
+    try:
+        snapshot = blacklist_snapshot.latest_snapshot()
+    except (OSError, ValueError) as e:
+        print(f"Could not read the latest blacklist snapshot: {e}")
+        return None, None
+    if snapshot is None:
+        return None, None
+    try:
+        return set(snapshot.entries()), snapshot.feed_hash
+    finally:
+        snapshot.close()
+
+def ensure_blacklist_jump(command):
+    """Create BLACKLIST_CHAIN if needed and make sure the hook chain jumps to it first."""
+    table, chain = blacklist_hook()
+    run_privileged([command, "-t", table, "-N", BLACKLIST_CHAIN], capture_output=True)
+    if run_privileged([command, "-t", table, "-C", chain, "-j", BLACKLIST_CHAIN],
+                      capture_output=True).returncode != 0:
+        result = run_privileged([command, "-t", table, "-I", chain, "-j", BLACKLIST_CHAIN],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"Failed to hook {BLACKLIST_CHAIN} into {chain}: {result.stderr}")
 
 def apply_blacklist(ip_list):
-    """Apply the blacklist by blocking each IP."""
+    """Apply the blacklist with one atomic iptables-restore / ip6tables-restore batch per family.
+
+    Only BLACKLIST_CHAIN is flushed and refilled, so rules owned by anything else survive.
+    """
     print("Applying blacklist...")
-    subprocess.run(["sudo", "iptables", "-F"])  # Flush existing rules
-    for ip in ip_list:
-        print(f"Processing IP: {ip}")
-        block_ip(ip)
+    table, _ = blacklist_hook()
+    with firewall_metrics.apply_seconds.time(stage="blacklist"):
+        for version, entries in split_by_family(ip_list).items():
+            command = FAMILIES[version][0]
+            # Flush the old entries and add the new ones in the same transaction.
+            lines = [f"*{table}", f":{BLACKLIST_CHAIN} - [0:0]", f"-F {BLACKLIST_CHAIN}"]
+            lines += [f"-A {BLACKLIST_CHAIN} -s {ip} -j DROP" for ip in entries]
+            lines.append("COMMIT")
+            result = run_privileged([f"{command}-restore", "--noflush"], input="\n".join(lines) + "\n",
+                                    capture_output=True, text=True)
+            if result.returncode != 0:
+                print(f"Failed to apply IPv{version} blacklist: {result.stderr}")
+                continue
+            ensure_blacklist_jump(command)
+            print(f"Blocked {len(entries)} IPv{version} entries.")
 
 def refined_rate_limit():
     """Apply refined rate limits using iptables."""
     print("Setting refined rate limits with iptables...")
-    subprocess.run(["sudo", "iptables", "-F"])  # Clear existing rules
-    subprocess.run(["sudo", "iptables", "-A", "INPUT", "-s", "127.0.0.1", "-j", "ACCEPT"])
+    run_privileged(["iptables", "-F", "INPUT"])  # Clear existing rules, keeping BLACKLIST_CHAIN
+    run_privileged(["iptables", "-A", "INPUT", "-s", "127.0.0.1", "-j", "ACCEPT"])
 
     # HTTP rate limiting - 20 req/min with burst limit of 50
-    subprocess.run(["sudo", "iptables", "-A", "INPUT", "-p", "tcp", "--dport", "80",
+    run_privileged(["iptables", "-A", "INPUT", "-p", "tcp", "--dport", "80",
                     "-m", "state", "--state", "NEW", "-m", "recent", "--set"])
-    subprocess.run(["sudo", "iptables", "-A", "INPUT", "-p", "tcp", "--dport", "80",
+    run_privileged(["iptables", "-A", "INPUT", "-p", "tcp", "--dport", "80",
                     "-m", "state", "--state", "NEW", "-m", "recent", "--update",
                     "--seconds", "60", "--hitcount", "20", "-j", "DROP"])
 
     # HTTPS rate limiting - 15 req/min with burst limit of 30
-    subprocess.run(["sudo", "iptables", "-A", "INPUT", "-p", "tcp", "--dport", "443",
+    run_privileged(["iptables", "-A", "INPUT", "-p", "tcp", "--dport", "443",
                     "-m", "state", "--state", "NEW", "-m", "recent", "--set"])
-    subprocess.run(["sudo", "iptables", "-A", "INPUT", "-p", "tcp", "--dport", "443",
+    run_privileged(["iptables", "-A", "INPUT", "-p", "tcp", "--dport", "443",
                     "-m", "state", "--state", "NEW", "-m", "recent", "--update",
                     "--seconds", "60", "--hitcount", "15", "-j", "DROP"])
 
     # Temporary ban for abusive IPs
-    subprocess.run(["sudo", "iptables", "-A", "INPUT", "-m", "recent", "--rcheck",
+    run_privileged(["iptables", "-A", "INPUT", "-m", "recent", "--rcheck",
                     "--seconds", "300", "--hitcount", "50", "-j", "DROP"])
-    subprocess.run(["sudo", "iptables", "-A", "INPUT", "-m", "recent", "--set"])
-    subprocess.run(["sudo", "iptables", "-A", "INPUT", "-m", "state", "--state",
+    run_privileged(["iptables", "-A", "INPUT", "-m", "recent", "--set"])
+    run_privileged(["iptables", "-A", "INPUT", "-m", "state", "--state",
                     "ESTABLISHED,RELATED", "-j", "ACCEPT"])
-    subprocess.run(["sudo", "iptables", "-A", "INPUT", "-j", "DROP"])
+    run_privileged(["iptables", "-A", "INPUT", "-j", "DROP"])
+    if BLACKLIST_TABLE == "filter":
+        ensure_blacklist_jump("iptables")
+
+def ec2_client():
+    """Create a boto3 EC2 client, honouring AWS_ENDPOINT_URL (e.g. a local moto server).
+
+    The connection pool is sized for the reconciler threads so none rebuild connections.
+    """
+    import boto3
+    from botocore.config import Config
+    return boto3.client("ec2", endpoint_url=os.environ.get("AWS_ENDPOINT_URL"),
+                        config=Config(max_pool_connections=SECURITY_GROUP_WORKERS))
+
+def ingress_rules(permissions):
+    """Flatten EC2 IpPermissions into a set of (protocol, from_port, to_port, cidr) rules."""
+    rules = set()
+    for permission in permissions:
+        ports = (permission.get("FromPort", -1), permission.get("ToPort", -1))
+        # Rules referencing other groups or prefix lists are left untouched.
+        for ip_range in permission.get("IpRanges", []):
+            rules.add((permission["IpProtocol"], *ports, ip_range["CidrIp"]))
+        for ip_range in permission.get("Ipv6Ranges", []):
+            rules.add((permission["IpProtocol"], *ports, ip_range["CidrIpv6"]))
+    return rules
+
+def ip_permissions(rules):
+    """Group (protocol, from_port, to_port, cidr) rules into the IpPermissions EC2 expects."""
+    permissions = {}
+    for protocol, from_port, to_port, cidr in sorted(rules):
+        permission = permissions.get((protocol, from_port, to_port))
+        if permission is None:
+            permission = {"IpProtocol": protocol}
+            if protocol != "-1":
+                permission.update(FromPort=from_port, ToPort=to_port)
+            permissions[(protocol, from_port, to_port)] = permission
+        if ":" in cidr:
+            permission.setdefault("Ipv6Ranges", []).append({"CidrIpv6": cidr})
+        else:
+            permission.setdefault("IpRanges", []).append({"CidrIp": cidr})
+    return list(permissions.values())
+
+def desired_ingress_rules(ports=INGRESS_PORTS, cidr=INGRESS_CIDR):
+    """Build the rule set opening each TCP port to the CIDR."""
+    return {("tcp", port, port, cidr) for port in ports}
+
+def describe_ingress_rules(client, group_ids):
+    """Fetch current ingress rules per group id with paginated describe calls.
+
+    Each rule is a (protocol, from_port, to_port, cidr) tuple; groups not found are left out.
+    """
+    current = {}
+    paginator = client.get_paginator("describe_security_groups")
+    for start in range(0, len(group_ids), SECURITY_GROUP_FILTER_LIMIT):
+        chunk = group_ids[start:start + SECURITY_GROUP_FILTER_LIMIT]
+        pages = paginator.paginate(Filters=[{"Name": "group-id", "Values": chunk}])
+        for page in pages:
+            for group in page["SecurityGroups"]:
+                current[group["GroupId"]] = ingress_rules(group["IpPermissions"])
+    return current
+
+def reconcile_security_group(client, group_id, current, desired, revoke=True):
+    """Apply the minimal authorize/revoke calls to bring one group from current to the desired rules."""
+    from botocore.exceptions import ClientError
+    for attempt in range(2):
+        to_authorize = desired - current
+        to_revoke = current - desired if revoke else set()
+        try:
+            if to_revoke:
+                client.revoke_security_group_ingress(GroupId=group_id, IpPermissions=ip_permissions(to_revoke))
+            if to_authorize:
+                client.authorize_security_group_ingress(GroupId=group_id, IpPermissions=ip_permissions(to_authorize))
+        except ClientError as e:
+            # The group changed since it was described; describe it again and retry once.
+            code = e.response["Error"]["Code"]
+            if code not in ("InvalidPermission.Duplicate", "InvalidPermission.NotFound") or attempt:
+                raise
+            current = describe_ingress_rules(client, [group_id]).get(group_id, set())
+            continue
+        return len(to_authorize), len(to_revoke)
+
+def reconcile_security_groups(group_ids, desired, revoke=True, client=None):
+    """Reconcile many security groups against one rule set using a bounded worker pool.
+
+    Every group is described once at the start of the pass. Returns the number of groups
+    that could not be reconciled, including those that were not found.
+    """
+    client = client or ec2_client()
+    group_ids = list(group_ids)
+    found = describe_ingress_rules(client, group_ids)
+    failures = 0
+    for group_id in group_ids:
+        if group_id not in found:
+            failures += 1
+            print(f"Security group {group_id} not found.")
+
+    def reconcile(group_id):
+        try:
+            return group_id, reconcile_security_group(client, group_id, found[group_id], desired, revoke)
+        except Exception as e:
+            return group_id, e
+
+    with ThreadPoolExecutor(max_workers=SECURITY_GROUP_WORKERS) as pool:
+        for group_id, result in pool.map(reconcile, list(found)):
+            if isinstance(result, Exception):
+                failures += 1
+                print(f"Failed to reconcile {group_id}: {result}")
+            elif any(result):
+                print(f"{group_id}: {result[0]} rules authorized, {result[1]} revoked.")
+    print(f"Reconciled {len(group_ids) - failures} of {len(group_ids)} security groups.")
+    return failures
+
+def sync_network_acl(client, acl, networks):
+    """Replace the blacklist deny entries of one network ACL with the top-ranked prefixes."""
+    acl_id = acl["NetworkAclId"]
+    for version, cidr_key in ((4, "CidrBlock"), (6, "Ipv6CidrBlock")):
+        # Each family gets its own block of reserved rule numbers, ahead of any allow rules.
+        base = NACL_DENY_RULE_BASE + (version == 6) * NACL_RULE_LIMIT
+        reserved = range(base, base + NACL_RULE_LIMIT)
+        inbound = [entry for entry in acl["Entries"]
+                   if not entry["Egress"] and cidr_key in entry and entry["RuleNumber"] < 32767]
+        current = {entry["RuleNumber"]: entry[cidr_key] for entry in inbound
+                   if entry["RuleNumber"] in reserved and entry["RuleAction"] == "deny"}
+        taken = {entry["RuleNumber"] for entry in inbound} - set(current)
+        slots = min(NACL_RULE_LIMIT - len(taken), len(reserved) - len(taken & set(reserved)))
+        desired = {str(n) for n in rank_prefixes([n for n in networks if n.version == version], slots)}
+
+        # Keep prefixes that are already in place and reuse the freed rule numbers.
+        kept = {number for number, cidr in current.items() if cidr in desired}
+        free = [number for number in reserved if number not in taken and number not in kept]
+        new_entries = dict(zip(free, sorted(desired - {current[number] for number in kept})))
+        for number in sorted(set(current) - kept - set(new_entries)):
+            client.delete_network_acl_entry(NetworkAclId=acl_id, RuleNumber=number, Egress=False)
+        for number, cidr in new_entries.items():
+            entry = {"NetworkAclId": acl_id, "RuleNumber": number, "Egress": False,
+                     "Protocol": "-1", "RuleAction": "deny", cidr_key: cidr}
+            if number in current:
+                client.replace_network_acl_entry(**entry)
+            else:
+                client.create_network_acl_entry(**entry)
+        print(f"{acl_id}: {len(kept) + len(new_entries)} IPv{version} deny entries "
+              f"({len(new_entries)} changed).")
+
+def push_blacklist_to_network_acls(ip_list, acl_ids=NETWORK_ACL_IDS, client=None):
+    """Deny the highest-value blacklist prefixes in VPC network ACLs, ahead of the hosts."""
+    if not acl_ids:
+        return
+    print("Pushing blacklist prefixes to network ACLs...")
+    client = client or ec2_client()
+    networks = aggregate_blacklist(ip_list)
+    for acl in client.describe_network_acls(NetworkAclIds=acl_ids)["NetworkAcls"]:
+        sync_network_acl(client, acl, networks)
 
 def setup_security_group():
-    """Configure AWS Security Group (if AWS CLI is installed and configured)."""
+    """Configure AWS Security Group (via boto3 if installed, otherwise the AWS CLI)."""
     print("Configuring AWS Security Group...")
-    security_group_id = "sg-0bc74359cce8c747a"  # Replace with your Security Group ID
-    subprocess.run(["aws", "ec2", "authorize-security-group-ingress", "--group-id", security_group_id,
-                    "--protocol", "tcp", "--port", "80", "--cidr", "0.0.0.0/0"])
-    subprocess.run(["aws", "ec2", "authorize-security-group-ingress", "--group-id", security_group_id,
-                    "--protocol", "tcp", "--port", "443", "--cidr", "0.0.0.0/0"])
-    subprocess.run(["aws", "ec2", "authorize-security-group-ingress", "--group-id", security_group_id,
-                    "--protocol", "tcp", "--port", "22", "--cidr", "0.0.0.0/0"])
+    try:
+        client = ec2_client()
+    except ImportError:
+        # Fall back to the AWS CLI, running one process per port concurrently.
+        processes = [subprocess.Popen(["aws", "ec2", "authorize-security-group-ingress",
+                                       "--group-id", SECURITY_GROUP_ID, "--protocol", "tcp",
+                                       "--port", str(port), "--cidr", INGRESS_CIDR])
+                     for port in INGRESS_PORTS]
+        for process in processes:
+            process.wait()
+    else:
+        # Only add what is missing; other rules on the group are left alone.
+        reconcile_security_groups([SECURITY_GROUP_ID], desired_ingress_rules(), revoke=False, client=client)
     print("AWS Security Group configured.")
 
 def main():
-    install_dependencies()
-    download_blacklist()
-    unzip_blacklist()
-    ip_list = parse_blacklist()
+    global BLACKLIST_TABLE
+    parser = argparse.ArgumentParser(description="Configure the firewall and AWS Security Group.")
+    parser.add_argument("--raw", action="store_true",
+                        help="drop blacklisted packets in the raw table, before connection tracking")
+    parser.add_argument("--install-dependencies", action="store_true",
+                        help="install the required packages with sudo before configuring")
+    parser.add_argument("--rollback", type=int, metavar="VERSION",
+                        help="re-apply a stored blacklist snapshot instead of downloading the feeds")
+    args = parser.parse_args()
+    if args.raw:
+        BLACKLIST_TABLE = "raw"
+    if args.rollback is not None:
+        apply_blacklist(blacklist_snapshot.restore_entries(args.rollback))
+        print(f"Rolled back to blacklist snapshot version {args.rollback}.")
+        return
+    if args.install_dependencies:
+        install_dependencies()
+    allowlist = load_allowlist()
+    stored, stored_hash = stored_blacklist()
+    merged = load_blacklist_feeds(allowlist=allowlist, known_hash=stored_hash)
+    if merged is None:
+        ip_list = stored
+    else:
+        ip_list = subtract_allowlist(merged, allowlist)
+    push_blacklist_to_network_acls(ip_list)
     apply_blacklist(ip_list)
-    refined_rate_limit()
+    if merged is not None:
+        persist_blacklist(ip_list, last_feed_hash)
+    with firewall_metrics.apply_seconds.time(stage="rate_limit"):
+        refined_rate_limit()
     setup_security_group()
+    firewall_metrics.collect_kernel_counters()
+    firewall_metrics.write_textfile()
     print("Firewall and Security Group configuration complete.")
 
 if __name__ == "__main__":
@@ -35,43 +35,134 @@ if this_python < min_version:
 
 
 import os.path
-import pkgutil
 import shutil
 import tempfile
 import argparse
-import importlib
+import functools
+import subprocess
+import time
 from base64 import b85decode
 
+# Version of the pip copy embedded in DATA below.
+PIP_VERSION = "24.3.1"
+
+
+# Packages the bootstrap may install, and so needs to know about beforehand.
+PROBED_PACKAGES = ("pip", "setuptools", "wheel")
+
+
+@functools.lru_cache(maxsize=None)
+def probe_environment():
+    """
+    Scan sys.path once for installed pip, setuptools and wheel.
+
+    Returns a dict mapping each package found to its version, or to None when
+    it has no version metadata. Each sys.path entry is listed a single time and
+    the first entry providing a package wins, as it would on import.
+    """
+    found = {}
+    versions = {}
+    for entry in sys.path:
+        try:
+            names = os.listdir(entry or ".")
+        except OSError:
+            # Missing directories, zip files and other non-directory entries.
+            continue
+        for name in names:
+            stem, _, suffix = name.rpartition(".")
+            if suffix in ("dist-info", "egg-info"):
+                project, _, rest = stem.partition("-")
+                project = project.lower().replace("_", "-")
+                if project in PROBED_PACKAGES and project not in versions:
+                    versions[project] = rest.split("-")[0] or None
+                    found.setdefault(project, None)
+            else:
+                module = stem if suffix == "py" else name
+                if module in PROBED_PACKAGES:
+                    found.setdefault(module, None)
+    for project in found:
+        found[project] = versions.get(project)
+    return found
+
+
+def installed_version(name):
+    """
+    Return the installed version of distribution `name`, or None if absent.
+    """
+    return probe_environment().get(name)
+
+
+def release_tuple(version):
+    """
+    Return the leading numeric release segment of `version` as a tuple.
+    """
+    release = []
+    for part in version.split("."):
+        if not part.isdigit():
+            break
+        release.append(int(part))
+    return tuple(release)
+
+
+def pip_satisfied():
+    """
+    Check whether the installed pip is at least as new as the embedded one.
+    """
+    version = installed_version("pip")
+    if version is None:
+        return False
+    release = release_tuple(version)
+    return bool(release) and release >= release_tuple(PIP_VERSION)
+
 
 def include_setuptools(args):
     """
     Install setuptools only if absent, not excluded and when using Python <3.12.
+
+    The cheap version and flag checks run first so that the environment is
+    only probed when the answer depends on it.
     """
-    cli = not args.no_setuptools
-    env = not os.environ.get("PIP_NO_SETUPTOOLS")
-    absent = not importlib.util.find_spec("setuptools")
-    python_lt_3_12 = this_python < (3, 12)
-    return cli and env and absent and python_lt_3_12
+    return (
+        this_python < (3, 12)
+        and not args.no_setuptools
+        and not os.environ.get("PIP_NO_SETUPTOOLS")
+        and "setuptools" not in probe_environment()
+    )
 
 
 def include_wheel(args):
     """
     Install wheel only if absent, not excluded and when using Python <3.12.
+
+    The cheap version and flag checks run first so that the environment is
+    only probed when the answer depends on it.
     """
-    cli = not args.no_wheel
-    env = not os.environ.get("PIP_NO_WHEEL")
-    absent = not importlib.util.find_spec("wheel")
-    python_lt_3_12 = this_python < (3, 12)
-    return cli and env and absent and python_lt_3_12
+    return (
+        this_python < (3, 12)
+        and not args.no_wheel
+        and not os.environ.get("PIP_NO_WHEEL")
+        and "wheel" not in probe_environment()
+    )
 
 
 def determine_pip_install_arguments():
+    """
+    Build the `pip install` arguments, or return None if there is nothing to do.
+
+    Without extra arguments only missing or outdated packages are installed;
+    pass --force-reinstall to reinstall everything unconditionally.
+    """
     pre_parser = argparse.ArgumentParser()
     pre_parser.add_argument("--no-setuptools", action="store_true")
     pre_parser.add_argument("--no-wheel", action="store_true")
+    pre_parser.add_argument("--force-reinstall", action="store_true")
     pre, args = pre_parser.parse_known_args()
 
-    args.append("pip")
+    # Any user-supplied requirement or option means pip has to run anyway.
+    skip_satisfied = not (pre.force_reinstall or args)
+
+    if not (skip_satisfied and pip_satisfied()):
+        args.append("pip")
 
     if include_setuptools(pre):
         args.append("setuptools")
@@ -79,10 +170,63 @@ def determine_pip_install_arguments():
     if include_wheel(pre):
         args.append("wheel")
 
-    return ["install", "--upgrade", "--force-reinstall"] + args
+    if not args:
+        return None
+
+    install = ["install", "--upgrade"]
+    if pre.force_reinstall:
+        install.append("--force-reinstall")
+    return install + args
+
+
+def bootstrap_cache_dir():
+    """
+    Return the directory used to keep artifacts between bootstrap runs.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(cache_home, "get-pip")
 
 
-def monkeypatch_for_cert(tmpdir):
+def materialize_cert(tmpdir, pip_zip):
+    """Return a path to the bundled cacert.pem, extracting it only when needed.
+
+    The certificate is cached under a name derived from the CRC-32 recorded in
+    the embedded archive. A cached copy is reused, without decompressing the
+    zip member, only if the CRC-32 of its contents matches, so a truncated or
+    corrupted file is replaced. If the cache is not writable the certificate
+    is written to the temporary directory instead.
+    """
+    import zlib
+    import zipfile
+
+    with zipfile.ZipFile(pip_zip) as archive:
+        info = archive.getinfo("pip/_vendor/certifi/cacert.pem")
+        cache_dir = bootstrap_cache_dir()
+        cert_path = os.path.join(cache_dir, "cacert-{:08x}.pem".format(info.CRC))
+        try:
+            with open(cert_path, "rb") as cached:
+                if zlib.crc32(cached.read()) == info.CRC:
+                    return cert_path
+        except OSError:
+            pass
+        data = archive.read(info)
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, partial_path = tempfile.mkstemp(dir=cache_dir, suffix=".pem")
+        with os.fdopen(fd, "wb") as cert:
+            cert.write(data)
+        os.replace(partial_path, cert_path)
+    except OSError:
+        cert_path = os.path.join(tmpdir, "cacert.pem")
+        with open(cert_path, "wb") as cert:
+            cert.write(data)
+    return cert_path
+
+
+def monkeypatch_for_cert(tmpdir, pip_zip):
     """Patches `pip install` to provide default certificate with the lowest priority.
 
     This ensures that the bundled certificates are used unless the user specifies a
@@ -93,48 +237,133 @@ def monkeypatch_for_cert(tmpdir):
     """
     from pip._internal.commands.install import InstallCommand
 
-    # We want to be using the internal certificates.
-    cert_path = os.path.join(tmpdir, "cacert.pem")
-    with open(cert_path, "wb") as cert:
-        cert.write(pkgutil.get_data("pip._vendor.certifi", "cacert.pem"))
-
     install_parse_args = InstallCommand.parse_args
 
     def cert_parse_args(self, args):
-        if not self.parser.get_default_values().cert:
-            # There are no user provided cert -- force use of bundled cert
-            self.parser.defaults["cert"] = cert_path  # calculated above
-        return install_parse_args(self, args)
+        options, remaining = install_parse_args(self, args)
+        if not options.cert:
+            # There are no user provided cert -- force use of bundled cert,
+            # materialized only now that we know it is needed
+            options.cert = materialize_cert(tmpdir, pip_zip)
+        return options, remaining
 
     InstallCommand.parse_args = cert_parse_args
 
 
-def bootstrap(tmpdir):
-    monkeypatch_for_cert(tmpdir)
+def bootstrap(tmpdir, pip_zip, args):
+    monkeypatch_for_cert(tmpdir, pip_zip)
 
     # Execute the included pip and use it to install the latest pip and
     # any user-requested packages from PyPI.
     from pip._internal.cli.main import main as pip_entry_point
-    args = determine_pip_install_arguments()
     sys.exit(pip_entry_point(args))
 
 
+def unpack_pip_zip(tmpdir):
+    """
+    Decode the embedded archive into `tmpdir` and return the path to pip.zip.
+    """
+    pip_zip = os.path.join(tmpdir, "pip.zip")
+    with open(pip_zip, "wb") as fp:
+        fp.write(b85decode(DATA.replace(b"\n", b"")))
+    return pip_zip
+
+
+def determine_driver_arguments():
+    """
+    Split the multi-interpreter driver options off the command line.
+    """
+    driver_parser = argparse.ArgumentParser(allow_abbrev=False)
+    driver_parser.add_argument("--interpreter", action="append", default=[])
+    driver_parser.add_argument("--jobs", type=int)
+    return driver_parser.parse_known_args()
+
+
+def bootstrap_interpreter(interpreter, pip_zip, args):
+    """
+    Run this script under `interpreter`, reusing an already decoded pip.zip.
+
+    Returns the interpreter, its exit code, the elapsed time and its output.
+    """
+    env = dict(os.environ, GET_PIP_ARCHIVE=pip_zip)
+    start = time.perf_counter()
+    try:
+        result = subprocess.run(
+            [interpreter, os.path.abspath(__file__)] + args,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+        )
+    except OSError as exc:
+        return interpreter, 1, time.perf_counter() - start, str(exc)
+    return interpreter, result.returncode, time.perf_counter() - start, result.stdout
+
+
+def drive(interpreters, jobs, args):
+    """
+    Bootstrap several interpreters concurrently from a single decoded payload.
+
+    Each target runs in its own process; at most `jobs` run at once, all of
+    them by default since the work is dominated by downloads and disk I/O.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        pip_zip = unpack_pip_zip(tmpdir)
+        failures = 0
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=jobs or len(interpreters)) as pool:
+            futures = [
+                pool.submit(bootstrap_interpreter, interpreter, pip_zip, args)
+                for interpreter in interpreters
+            ]
+            for future in as_completed(futures):
+                interpreter, returncode, elapsed, output = future.result()
+                if returncode:
+                    failures += 1
+                    status = "failed (exit code {})".format(returncode)
+                else:
+                    status = "ok"
+                print("{}: {} in {:.2f}s".format(interpreter, status, elapsed))
+                if returncode:
+                    for line in output.splitlines():
+                        print("    " + line)
+        print("Bootstrapped {} of {} interpreters in {:.2f}s.".format(
+            len(interpreters) - failures, len(interpreters), time.perf_counter() - start
+        ))
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return failures
+
+
 def main():
+    driver, driver_args = determine_driver_arguments()
+    if driver.interpreter:
+        sys.exit(1 if drive(driver.interpreter, driver.jobs, driver_args) else 0)
+
+    # Check the environment before the embedded pip shadows it on sys.path,
+    # so the common already-installed case never decodes the payload.
+    args = determine_pip_install_arguments()
+    if args is None:
+        print("Requirement already satisfied: pip {} or newer.".format(PIP_VERSION))
+        return
+
     tmpdir = None
     try:
         # Create a temporary working directory
         tmpdir = tempfile.mkdtemp()
 
-        # Unpack the zipfile into the temporary directory
-        pip_zip = os.path.join(tmpdir, "pip.zip")
-        with open(pip_zip, "wb") as fp:
-            fp.write(b85decode(DATA.replace(b"\n", b"")))
+        # Reuse the archive decoded by a driver process, if any, otherwise
+        # unpack the zipfile into the temporary directory
+        pip_zip = os.environ.get("GET_PIP_ARCHIVE") or unpack_pip_zip(tmpdir)
 
         # Add the zipfile to sys.path so that we can import it
         sys.path.insert(0, pip_zip)
 
         # Run the bootstrap
-        bootstrap(tmpdir=tmpdir)
+        bootstrap(tmpdir=tmpdir, pip_zip=pip_zip, args=args)
     finally:
         # Clean up our temporary working directory
         if tmpdir:
@@ -0,0 +1,137 @@
+import shlex
+import argparse
+import ipaddress
+import firewall_metrics
+from firewall_helper import run_privileged
+
+TERMINATING_TARGETS = {"ACCEPT", "DROP", "REJECT"}
+# Matches that keep state of their own, so evaluating them more or less often changes behaviour.
+STATEFUL_MATCHES = {"recent", "limit", "hashlimit", "connlimit", "quota", "statistic"}
+
+def parse_rule(rule):
+    """Describe the parts of an iptables-save rule that matter for reordering it.
+
+    Fields are None when the rule does not constrain them or negates them, since a
+    negated match cannot be used to prove two rules disjoint.
+    """
+    tokens = shlex.split(rule)
+    match = {"protocol": None, "source": None, "destination": None, "dport": None,
+             "state": None, "interface": None, "target": "", "stateful": False}
+    negate = False
+    i = 2  # Skip "-A CHAIN"
+    while i < len(tokens):
+        token = tokens[i]
+        value = tokens[i + 1] if i + 1 < len(tokens) else None
+        if token == "!":
+            negate = True
+            i += 1
+            continue
+        if token == "-j":
+            match["target"] = " ".join(tokens[i + 1:])
+            break
+        if token == "-m" and value in STATEFUL_MATCHES:
+            match["stateful"] = True
+        if not negate:
+            if token == "-p":
+                match["protocol"] = value
+            elif token == "-s":
+                match["source"] = ipaddress.ip_network(value, strict=False)
+            elif token == "-d":
+                match["destination"] = ipaddress.ip_network(value, strict=False)
+            elif token == "--dport":
+                low, _, high = value.partition(":")
+                match["dport"] = (int(low), int(high or low))
+            elif token in ("--state", "--ctstate"):
+                match["state"] = set(value.split(","))
+            elif token == "-i" and not value.endswith("+"):
+                match["interface"] = value
+        negate = False
+        i += 1 if value is None or value.startswith("-") else 2
+    return match
+
+def disjoint(a, b):
+    """Return True if no packet can match both rules."""
+    if a["protocol"] and b["protocol"] and a["protocol"] != b["protocol"]:
+        return True
+    if a["dport"] and b["dport"] and (a["dport"][1] < b["dport"][0] or b["dport"][1] < a["dport"][0]):
+        return True
+    for field in ("source", "destination"):
+        if a[field] and b[field] and (a[field].version != b[field].version or not a[field].overlaps(b[field])):
+            return True
+    if a["state"] and b["state"] and not a["state"] & b["state"]:
+        return True
+    return bool(a["interface"] and b["interface"] and a["interface"] != b["interface"])
+
+def can_swap(a, b):
+    """Return True if swapping two adjacent rules cannot change any packet's fate."""
+    if disjoint(a, b):
+        return True
+    # Overlapping rules commute only if both end evaluation the same way without side effects.
+    # Rules without -j (accounting, recent --set) have an empty target and never qualify.
+    return (a["target"] == b["target"] and a["target"] and a["target"].split()[0] in TERMINATING_TARGETS
+            and not a["stateful"] and not b["stateful"])
+
+def average_traversal(hits):
+    """Average number of rules a matching packet passes through, given hits in chain order."""
+    total = sum(hits)
+    return sum(position * count for position, count in enumerate(hits, 1)) / total if total else 0
+
+def optimize_order(counters):
+    """Reorder rules so hotter ones come first, moving a rule only past rules it commutes with.
+
+    Works like an insertion sort over adjacent swaps, each proven safe by can_swap, so the
+    cost is proportional to how far rules actually move.
+    """
+    ordered = []
+    for counter in counters:
+        match = parse_rule(counter.rule)
+        position = len(ordered)
+        while (position and ordered[position - 1][0].packets < counter.packets
+               and can_swap(ordered[position - 1][1], match)):
+            position -= 1
+        ordered.insert(position, (counter, match))
+    return [counter for counter, _ in ordered]
+
+def optimize_chain(chain="INPUT", table="filter", apply=False):
+    """Plan, and optionally apply, a hit-frequency ordering for one chain."""
+    result = run_privileged(["iptables-save", "-c", "-t", table], capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"Failed to read iptables rules: {result.stderr}")
+        return
+    counters = [c for c in firewall_metrics.parse_rule_counters(result.stdout) if c.chain == chain]
+    ordered = optimize_order(counters)
+    before = average_traversal([c.packets for c in counters])
+    after = average_traversal([c.packets for c in ordered])
+    moved = sum(1 for old, new in zip(counters, ordered) if old is not new)
+    print(f"{chain}: {moved} of {len(counters)} rules move, average rules traversed "
+          f"{before:.2f} -> {after:.2f}.")
+    if not apply or not moved:
+        return
+
+    # Rewrite the chain in place and restore the whole table atomically, keeping counters.
+    lines = []
+    replaced = False
+    for line in result.stdout.splitlines():
+        if line.startswith("[") and line[line.index("]") + 2:].split(None, 2)[1] == chain:
+            if not replaced:
+                lines.extend(f"[{c.packets}:{c.bytes}] {c.rule}" for c in ordered)
+                replaced = True
+            continue
+        lines.append(line)
+    restore = run_privileged(["iptables-restore", "-c"], input="\n".join(lines) + "\n",
+                             capture_output=True, text=True)
+    if restore.returncode != 0:
+        print(f"Failed to reorder {chain}: {restore.stderr}")
+    else:
+        print(f"{chain} reordered.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Reorder iptables rules by observed hit counts.")
+    parser.add_argument("--chain", default="INPUT")
+    parser.add_argument("--table", default="filter")
+    parser.add_argument("--apply", action="store_true", help="apply the plan instead of only printing it")
+    args = parser.parse_args()
+    optimize_chain(args.chain, args.table, args.apply)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import os
+import sys
+import importlib.util
+
+import pytest
+
+# The scripts under test live at the repository root, outside any package.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="module")
+def get_pip():
+    """The get-pip script, loaded under another name so it does not shadow the pip package."""
+    spec = importlib.util.spec_from_file_location("get_pip", os.path.join(ROOT, "pip.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def ec2(monkeypatch):
+    """An EC2 client talking to moto's in-process AWS stand-in."""
+    boto3 = pytest.importorskip("boto3")
+    moto = pytest.importorskip("moto")
+    for name, value in (("AWS_ACCESS_KEY_ID", "testing"), ("AWS_SECRET_ACCESS_KEY", "testing"),
+                        ("AWS_DEFAULT_REGION", "us-east-1")):
+        monkeypatch.setenv(name, value)
+    monkeypatch.delenv("AWS_ENDPOINT_URL", raising=False)
+    with moto.mock_aws():
+        yield boto3.client("ec2", region_name="us-east-1")
@@ -0,0 +1,56 @@
+import random
+import ipaddress
+
+import firewall_script
+
+
+def addresses(entries):
+    """Expand entries into the set of addresses they cover."""
+    return {address for entry in entries for address in ipaddress.ip_network(entry)}
+
+
+def test_partial_overlap_is_split_into_remaining_networks():
+    result = firewall_script.subtract_allowlist({"192.0.2.0/24"}, ["192.0.2.64/26"])
+    assert result == {"192.0.2.0/26", "192.0.2.128/25"}
+
+
+def test_entries_inside_or_outside_the_allowlist():
+    result = firewall_script.subtract_allowlist({"10.1.2.3", "10.0.0.0/8", "203.0.113.9"}, ["10.0.0.0/8"])
+    assert result == {"203.0.113.9"}
+
+
+def test_adjacent_allow_ranges_are_merged():
+    # Two adjacent /25s cover the /24 together, though neither does alone.
+    allowlist = ["198.51.100.0/25", "198.51.100.128/25"]
+    assert firewall_script.subtract_allowlist({"198.51.100.0/24", "198.51.100.7"}, allowlist) == set()
+    assert firewall_script.subtract_allowlist({"198.51.100.0/23"}, allowlist) == {"198.51.101.0/24"}
+
+
+def test_overlapping_allow_ranges_and_several_holes():
+    allowlist = ["192.0.2.16/28", "192.0.2.20/30", "192.0.2.200/32"]
+    result = firewall_script.subtract_allowlist({"192.0.2.0/24"}, allowlist)
+    assert addresses(result) == addresses(["192.0.2.0/24"]) - addresses(allowlist)
+    assert "192.0.2.0/28" in result and "192.0.2.201" in result
+
+
+def test_ipv6_entries():
+    result = firewall_script.subtract_allowlist({"2001:db8::/32", "2001:db9::1", "192.0.2.1"},
+                                                ["2001:db8::/33", "2001:db9::/64"])
+    assert result == {"2001:db8:8000::/33", "192.0.2.1"}
+
+
+def test_dict_input_keeps_tags():
+    ip_list = {"192.0.2.0/24": "feed-a", "198.51.100.1": "feed-b", "203.0.113.5": "feed-c"}
+    result = firewall_script.subtract_allowlist(ip_list, ["192.0.2.0/25", "203.0.113.5"])
+    assert result == {"192.0.2.128/25": "feed-a", "198.51.100.1": "feed-b"}
+
+
+def test_matches_brute_force_address_sets():
+    rng = random.Random(40)
+    for _ in range(50):
+        blacklist = {firewall_script.normalize_entry(f"10.0.{rng.randrange(4)}.{rng.randrange(256)}/{rng.randrange(22, 33)}")
+                     for _ in range(8)}
+        allowlist = [f"10.0.{rng.randrange(4)}.{rng.randrange(256)}/{rng.randrange(24, 33)}" for _ in range(5)]
+        result = firewall_script.subtract_allowlist(blacklist, allowlist)
+        assert addresses(result) == addresses(blacklist) - addresses(
+            str(ipaddress.ip_network(entry, strict=False)) for entry in allowlist)
@@ -0,0 +1,41 @@
+import io
+import gzip
+import zipfile
+
+import pytest
+
+import firewall_script
+
+
+def zip_feed(text):
+    content = io.BytesIO()
+    with zipfile.ZipFile(content, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(firewall_script.BLACKLIST_MEMBER, text)
+    return {"format": "zip", "member": firewall_script.BLACKLIST_MEMBER, "tag": "zip"}, content.getvalue()
+
+
+def gzip_feed(text):
+    return {"format": "gzip", "tag": "gzip"}, gzip.compress(text.encode())
+
+
+@pytest.mark.parametrize("make_feed", [zip_feed, gzip_feed])
+def test_feed_is_unwrapped(make_feed):
+    feed, content = make_feed("192.0.2.1\n198.51.100.0/24 # comment\n")
+    entries, invalid, lines = firewall_script.parse_feed(feed, content)
+    assert entries == ["192.0.2.1", "198.51.100.0/24"]
+    assert (invalid, lines) == (0, 2)
+
+
+@pytest.mark.parametrize("make_feed", [zip_feed, gzip_feed])
+def test_compression_bomb_is_refused(make_feed, monkeypatch):
+    monkeypatch.setattr(firewall_script, "UNZIP_CHUNK", 4096)
+    feed, content = make_feed("0" * (1 << 22))
+    with pytest.raises(ValueError, match="inflate"):
+        firewall_script.parse_feed(feed, content)
+
+
+def test_gzip_feed_over_the_size_limit_is_refused(monkeypatch):
+    monkeypatch.setattr(firewall_script, "BLACKLIST_MAX_BYTES", 1000)
+    feed, content = gzip_feed("".join(f"10.0.{i // 256}.{i % 256}\n" for i in range(2000)))
+    with pytest.raises(ValueError, match="inflated past 1000 bytes"):
+        firewall_script.parse_feed(feed, content)
@@ -0,0 +1,115 @@
+import collections
+
+import pytest
+
+pytest.importorskip("boto3")
+pytest.importorskip("moto")
+
+import firewall_script
+
+
+
+class CountingClient:
+    """Pass calls through to an EC2 client, counting the ones that change network ACLs."""
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = collections.Counter()
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        def call(**kwargs):
+            self.calls[name] += 1
+            return method(**kwargs)
+
+        return call
+
+    def changes(self):
+        return sum(count for name, count in self.calls.items() if not name.startswith("describe"))
+
+
+@pytest.fixture
+def acl_id(ec2):
+    vpc_id = ec2.create_vpc(CidrBlock="10.0.0.0/16")["Vpc"]["VpcId"]
+    acl_id = ec2.create_network_acl(VpcId=vpc_id)["NetworkAcl"]["NetworkAclId"]
+    # Rules owned by someone else, one of them inside the reserved IPv4 block.
+    for number in (5, 100):
+        ec2.create_network_acl_entry(NetworkAclId=acl_id, RuleNumber=number, Egress=False, Protocol="6",
+                                     RuleAction="allow", CidrBlock="0.0.0.0/0",
+                                     PortRange={"From": 443, "To": 443})
+    return acl_id
+
+
+def inbound(ec2, acl_id):
+    """Return {rule number: (action, cidr)} of the inbound custom entries of an ACL."""
+    acl = ec2.describe_network_acls(NetworkAclIds=[acl_id])["NetworkAcls"][0]
+    return {entry["RuleNumber"]: (entry["RuleAction"], entry.get("CidrBlock") or entry.get("Ipv6CidrBlock"))
+            for entry in acl["Entries"] if not entry["Egress"] and entry["RuleNumber"] < 32767}
+
+
+def denied(entries):
+    return {number: cidr for number, (action, cidr) in entries.items() if action == "deny"}
+
+
+def blacklist(first, last, extra=()):
+    """/24 networks 10.first.0.0 to 10.last.0.0, as the /32 hosts feeds list, plus extra entries."""
+    hosts = {f"10.{i}.0.{host}" for i in range(first, last + 1) for host in range(256)}
+    return hosts | set(extra)
+
+
+def test_create_fills_free_reserved_numbers(ec2, acl_id):
+    firewall_script.push_blacklist_to_network_acls(
+        blacklist(0, 29, extra=["2001:db8::/48", "2001:db9::1"]), [acl_id], ec2)
+    entries = inbound(ec2, acl_id)
+    deny = denied(entries)
+
+    # Both foreign rules survive and rule 5 is skipped; they also count against the quota.
+    assert entries[5] == ("allow", "0.0.0.0/0") and entries[100] == ("allow", "0.0.0.0/0")
+    ipv4 = {number: cidr for number, cidr in deny.items() if ":" not in cidr}
+    assert set(ipv4) == set(range(1, 20)) - {5}
+    assert sorted(ipv4.values()) == sorted(f"10.{i}.0.0/24" for i in range(18))
+    ipv6 = {number: cidr for number, cidr in deny.items() if ":" in cidr}
+    assert set(ipv6) == {21, 22}
+    assert set(ipv6.values()) == {"2001:db8::/48", "2001:db9::1/128"}
+
+
+def test_rerun_changes_nothing(ec2, acl_id):
+    ip_list = blacklist(0, 29, extra=["2001:db8::/48"])
+    firewall_script.push_blacklist_to_network_acls(ip_list, [acl_id], ec2)
+    before = inbound(ec2, acl_id)
+
+    client = CountingClient(ec2)
+    firewall_script.push_blacklist_to_network_acls(ip_list, [acl_id], client)
+    assert client.changes() == 0
+    assert inbound(ec2, acl_id) == before
+
+
+def test_replace_keeps_numbers_of_prefixes_still_wanted(ec2, acl_id):
+    firewall_script.push_blacklist_to_network_acls(blacklist(0, 29), [acl_id], ec2)
+    before = denied(inbound(ec2, acl_id))
+
+    # 10.0-10.2 drop out, and a /16 now outranks every /24.
+    client = CountingClient(ec2)
+    firewall_script.push_blacklist_to_network_acls(blacklist(3, 29, extra=["10.50.0.0/16"]), [acl_id], client)
+    after = denied(inbound(ec2, acl_id))
+
+    assert client.calls["replace_network_acl_entry"] == 3
+    assert client.calls["create_network_acl_entry"] == 0
+    assert client.calls["delete_network_acl_entry"] == 0
+    assert sorted(after.values()) == sorted(["10.50.0.0/16"] + [f"10.{i}.0.0/24" for i in range(3, 20)])
+    for number, cidr in before.items():
+        if cidr in after.values():
+            assert after[number] == cidr
+
+
+def test_delete_entries_no_longer_wanted(ec2, acl_id):
+    firewall_script.push_blacklist_to_network_acls(blacklist(0, 29), [acl_id], ec2)
+
+    client = CountingClient(ec2)
+    firewall_script.push_blacklist_to_network_acls(blacklist(0, 1), [acl_id], client)
+    entries = inbound(ec2, acl_id)
+
+    assert client.calls["delete_network_acl_entry"] == 16
+    assert sorted(denied(entries).values()) == ["10.0.0.0/24", "10.1.0.0/24"]
+    assert entries[5][0] == "allow" and entries[100][0] == "allow"
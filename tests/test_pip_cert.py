@@ -0,0 +1,75 @@
+import os
+import sys
+import zlib
+import zipfile
+
+import pytest
+
+CERT_MEMBER = "pip/_vendor/certifi/cacert.pem"
+
+
+@pytest.fixture
+def pip_zip(get_pip, tmp_path_factory):
+    return get_pip.unpack_pip_zip(str(tmp_path_factory.mktemp("archive")))
+
+
+@pytest.fixture
+def cache_home(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    return tmp_path / "cache"
+
+
+def bundled_cert(pip_zip):
+    with zipfile.ZipFile(pip_zip) as archive:
+        return archive.read(CERT_MEMBER)
+
+
+def test_cert_is_cached_and_reused(get_pip, pip_zip, cache_home, tmp_path):
+    cert_path = get_pip.materialize_cert(str(tmp_path), pip_zip)
+    assert cert_path.startswith(str(cache_home))
+    mtime = os.stat(cert_path).st_mtime_ns
+    assert get_pip.materialize_cert(str(tmp_path), pip_zip) == cert_path
+    assert os.stat(cert_path).st_mtime_ns == mtime
+
+
+def test_corrupted_cache_of_the_same_size_is_replaced(get_pip, pip_zip, cache_home, tmp_path):
+    data = bundled_cert(pip_zip)
+    cert_path = get_pip.materialize_cert(str(tmp_path), pip_zip)
+    with open(cert_path, "wb") as cert:
+        cert.write(b"\0" * len(data))
+
+    assert get_pip.materialize_cert(str(tmp_path), pip_zip) == cert_path
+    with open(cert_path, "rb") as cert:
+        assert zlib.crc32(cert.read()) == zlib.crc32(data)
+
+
+@pytest.fixture
+def install_command(get_pip, pip_zip, monkeypatch):
+    """Patch the bundled pip's InstallCommand like the bootstrap does, recording materialize_cert calls."""
+    # The bundled pip is imported from the archive, as the bootstrap does, then forgotten.
+    for name in [name for name in sys.modules if name == "pip" or name.startswith("pip.")]:
+        monkeypatch.delitem(sys.modules, name)
+    monkeypatch.syspath_prepend(pip_zip)
+    monkeypatch.delenv("PIP_CERT", raising=False)
+    monkeypatch.setenv("PIP_CONFIG_FILE", os.devnull)
+    calls = []
+    monkeypatch.setattr(get_pip, "materialize_cert", lambda *args: calls.append(args) or "/bundled.pem")
+    get_pip.monkeypatch_for_cert("/unused", pip_zip)
+    from pip._internal.commands import create_command
+    yield create_command("install"), calls
+    for name in [name for name in sys.modules if name == "pip" or name.startswith("pip.")]:
+        del sys.modules[name]
+
+
+def test_cert_on_the_command_line_skips_the_bundled_cert(install_command):
+    command, calls = install_command
+    options, _ = command.parse_args(["--cert", "/etc/ssl/custom.pem", "pip"])
+    assert options.cert == "/etc/ssl/custom.pem"
+    assert calls == []
+
+
+def test_bundled_cert_is_used_without_a_user_cert(install_command):
+    command, calls = install_command
+    options, _ = command.parse_args(["pip"])
+    assert options.cert == "/bundled.pem"
+    assert len(calls) == 1
@@ -0,0 +1,71 @@
+import sys
+
+import pytest
+
+
+@pytest.fixture
+def environment(get_pip, monkeypatch):
+    """Pretend the given packages are installed, on a Python that still gets setuptools and wheel."""
+    monkeypatch.setattr(get_pip, "this_python", (3, 11))
+    monkeypatch.setattr(get_pip, "PIP_VERSION", "24.3.1")
+    monkeypatch.delenv("PIP_NO_SETUPTOOLS", raising=False)
+    monkeypatch.delenv("PIP_NO_WHEEL", raising=False)
+
+    def install(**packages):
+        monkeypatch.setattr(get_pip, "probe_environment", lambda: packages)
+
+    return install
+
+
+def install_arguments(get_pip, monkeypatch, *argv):
+    monkeypatch.setattr(sys, "argv", ["get-pip.py", *argv])
+    return get_pip.determine_pip_install_arguments()
+
+
+@pytest.mark.parametrize("version, satisfied", [
+    ("24.3.1", True), ("25.0", True), ("24.10", True), ("24.3", False), ("23.3.2", False), (None, False),
+])
+def test_pip_satisfied(get_pip, environment, version, satisfied):
+    environment(pip=version)
+    assert get_pip.pip_satisfied() is satisfied
+
+
+def test_pip_missing_is_not_satisfied(get_pip, environment):
+    environment()
+    assert not get_pip.pip_satisfied()
+
+
+def test_satisfied_environment_is_skipped(get_pip, environment, monkeypatch):
+    environment(pip="24.3.1", setuptools="75.0.0", wheel="0.44.0")
+    assert install_arguments(get_pip, monkeypatch) is None
+
+
+def test_only_missing_packages_are_installed(get_pip, environment, monkeypatch):
+    environment(pip="24.3.1", setuptools="75.0.0")
+    assert install_arguments(get_pip, monkeypatch) == ["install", "--upgrade", "wheel"]
+
+    environment(pip="23.0", wheel="0.44.0")
+    assert install_arguments(get_pip, monkeypatch) == ["install", "--upgrade", "pip", "setuptools"]
+
+
+def test_force_reinstall_installs_pip_even_when_satisfied(get_pip, environment, monkeypatch):
+    environment(pip="24.3.1", setuptools="75.0.0", wheel="0.44.0")
+    assert install_arguments(get_pip, monkeypatch, "--force-reinstall") == [
+        "install", "--upgrade", "--force-reinstall", "pip"]
+
+
+def test_user_arguments_are_passed_through(get_pip, environment, monkeypatch):
+    environment(pip="24.3.1", wheel="0.44.0")
+    assert install_arguments(get_pip, monkeypatch, "--no-setuptools", "requests", "--index-url", "https://example.invalid/simple") == [
+        "install", "--upgrade", "requests", "--index-url", "https://example.invalid/simple", "pip"]
+
+
+def test_opt_outs_leave_nothing_to_do(get_pip, environment, monkeypatch):
+    environment(pip="24.3.1")
+    assert install_arguments(get_pip, monkeypatch, "--no-setuptools", "--no-wheel") is None
+
+
+def test_python_3_12_never_gets_setuptools_or_wheel(get_pip, environment, monkeypatch):
+    environment(pip="24.0")
+    monkeypatch.setattr(get_pip, "this_python", (3, 12))
+    assert install_arguments(get_pip, monkeypatch) == ["install", "--upgrade", "pip"]
@@ -0,0 +1,94 @@
+import os
+import sys
+import posix
+import argparse
+import importlib
+import importlib.util
+import importlib.metadata
+import collections
+
+import pytest
+
+
+@pytest.fixture
+def filesystem_calls(monkeypatch):
+    """Count stat and directory listing calls, including those made by importlib."""
+    calls = collections.Counter()
+    for name in ("stat", "lstat", "listdir", "scandir"):
+        real = getattr(posix, name)
+
+        def counting(*args, _real=real, _name=name, **kwargs):
+            calls[_name] += 1
+            return _real(*args, **kwargs)
+
+        monkeypatch.setattr(posix, name, counting)
+        monkeypatch.setattr(os, name, counting)
+    return calls
+
+
+def cold_caches(get_pip):
+    get_pip.probe_environment.cache_clear()
+    sys.path_importer_cache.clear()
+    importlib.invalidate_caches()
+
+
+def legacy_startup_checks():
+    """The checks the bootstrap ran before the environment probe was introduced."""
+    importlib.util.find_spec("setuptools")
+    importlib.util.find_spec("wheel")
+    try:
+        importlib.metadata.version("pip")
+    except importlib.metadata.PackageNotFoundError:
+        pass
+
+
+def startup_checks(get_pip):
+    args = argparse.Namespace(no_setuptools=False, no_wheel=False)
+    get_pip.include_setuptools(args)
+    get_pip.include_wheel(args)
+    get_pip.installed_version("pip")
+
+
+@pytest.mark.skipif(sys.version_info >= (3, 12), reason="setuptools and wheel are never probed on 3.12+")
+def test_probe_makes_fewer_filesystem_calls(get_pip, filesystem_calls):
+    cold_caches(get_pip)
+    legacy_startup_checks()
+    legacy = sum(filesystem_calls.values())
+
+    cold_caches(get_pip)
+    filesystem_calls.clear()
+    startup_checks(get_pip)
+    probed = sum(filesystem_calls.values())
+
+    assert probed < legacy
+
+
+def test_probe_lists_each_path_entry_once(get_pip, filesystem_calls):
+    cold_caches(get_pip)
+    get_pip.probe_environment()
+    get_pip.installed_version("setuptools")
+    get_pip.installed_version("wheel")
+    assert filesystem_calls["listdir"] == len(sys.path)
+    assert filesystem_calls["stat"] == 0
+
+
+def test_opt_outs_skip_the_probe(get_pip, filesystem_calls, monkeypatch):
+    cold_caches(get_pip)
+    monkeypatch.setenv("PIP_NO_SETUPTOOLS", "1")
+    args = argparse.Namespace(no_setuptools=False, no_wheel=True)
+    assert not get_pip.include_setuptools(args)
+    assert not get_pip.include_wheel(args)
+    assert sum(filesystem_calls.values()) == 0
+
+
+def test_probe_agrees_with_importlib(get_pip):
+    cold_caches(get_pip)
+    found = get_pip.probe_environment()
+    for name in get_pip.PROBED_PACKAGES:
+        assert (name in found) == (importlib.util.find_spec(name) is not None), name
+        try:
+            version = importlib.metadata.version(name)
+        except importlib.metadata.PackageNotFoundError:
+            version = None
+        assert get_pip.installed_version(name) == version, name
+    assert found.get("pip") is not None
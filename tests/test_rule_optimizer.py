@@ -0,0 +1,99 @@
+import firewall_metrics
+import rule_optimizer
+
+# iptables-save -c output for the chain refined_rate_limit installs, plus one hot HTTPS rule.
+SAVED = """\
+# Generated by iptables-save v1.8.8 on Mon Oct 19 12:00:00 2026
+*filter
+:INPUT ACCEPT [0:0]
+:FORWARD ACCEPT [0:0]
+:OUTPUT ACCEPT [120:9000]
+[10:600] -A INPUT -s 127.0.0.1/32 -j ACCEPT
+[50:3000] -A INPUT -p tcp -m tcp --dport 80 -m state --state NEW -m recent --set --name DEFAULT --mask 255.255.255.255 --rsource
+[2:120] -A INPUT -p tcp -m tcp --dport 80 -m state --state NEW -m recent --update --seconds 60 --hitcount 20 --name DEFAULT --mask 255.255.255.255 --rsource -j DROP
+[900:54000] -A INPUT -p tcp -m tcp --dport 443 -m state --state NEW -j ACCEPT
+[0:0] -A INPUT -m recent --rcheck --seconds 300 --hitcount 50 --name DEFAULT --mask 255.255.255.255 --rsource -j DROP
+[400:24000] -A INPUT -m recent --set --name DEFAULT --mask 255.255.255.255 --rsource
+[5000:300000] -A INPUT -m state --state RELATED,ESTABLISHED -j ACCEPT
+[30:1800] -A INPUT -j DROP
+COMMIT
+# Completed on Mon Oct 19 12:00:00 2026
+"""
+
+
+def saved_rules():
+    return {counter.rule: counter for counter in firewall_metrics.parse_rule_counters(SAVED)}
+
+
+def rule(text):
+    return rule_optimizer.parse_rule(f"-A INPUT {text}")
+
+
+def test_parse_saved_rule():
+    match = rule("-s 192.0.2.0/24 -p tcp -m tcp --dport 8000:8080 -m state --state NEW,ESTABLISHED -i eth0 -j REJECT --reject-with icmp-port-unreachable")
+    assert str(match["source"]) == "192.0.2.0/24"
+    assert match["protocol"] == "tcp"
+    assert match["dport"] == (8000, 8080)
+    assert match["state"] == {"NEW", "ESTABLISHED"}
+    assert match["interface"] == "eth0"
+    assert match["target"] == "REJECT --reject-with icmp-port-unreachable"
+    assert not match["stateful"]
+
+
+def test_saved_recent_rule_is_stateful_without_target():
+    match = rule("-m recent --set --name DEFAULT --mask 255.255.255.255 --rsource")
+    assert match["stateful"]
+    assert match["target"] == ""
+
+
+def test_negated_matches_are_not_used_to_prove_disjointness():
+    not_tcp = rule("! -p tcp -j DROP")
+    udp = rule("-p udp -j ACCEPT")
+    outside = rule("! -s 10.0.0.0/8 -p udp -m udp --dport 53 -j ACCEPT")
+    assert not_tcp["protocol"] is None
+    assert outside["source"] is None and outside["protocol"] == "udp"
+    # A UDP packet matches both, so they neither look disjoint nor commute.
+    assert not rule_optimizer.disjoint(not_tcp, udp)
+    assert not rule_optimizer.can_swap(not_tcp, udp)
+    assert not rule_optimizer.can_swap(rule("-s 10.1.0.0/16 -j DROP"), outside)
+
+
+def test_disjoint_rules_commute():
+    assert rule_optimizer.disjoint(rule("-p tcp -m tcp --dport 80 -j DROP"), rule("-p tcp -m tcp --dport 443 -j ACCEPT"))
+    assert rule_optimizer.disjoint(rule("-s 192.0.2.0/24 -j DROP"), rule("-s 198.51.100.0/24 -j ACCEPT"))
+    assert rule_optimizer.disjoint(rule("-s 192.0.2.0/24 -j DROP"), rule("-s 2001:db8::/32 -j ACCEPT"))
+    assert rule_optimizer.disjoint(rule("-m state --state NEW -j DROP"),
+                                   rule("-m state --state RELATED,ESTABLISHED -j ACCEPT"))
+    assert rule_optimizer.can_swap(rule("-i eth0 -j DROP"), rule("-i eth1 -j ACCEPT"))
+
+
+def test_overlapping_rules_without_target_never_commute():
+    counting = rule("-p tcp -m tcp --dport 80")
+    assert not rule_optimizer.can_swap(counting, rule("-p tcp -m tcp --dport 80"))
+    assert not rule_optimizer.can_swap(counting, rule("-p tcp -m tcp --dport 80 -j ACCEPT"))
+    assert not rule_optimizer.can_swap(rule("-p tcp -j ACCEPT"), counting)
+
+
+def test_overlapping_rules_commute_only_with_the_same_stateless_verdict():
+    assert rule_optimizer.can_swap(rule("-s 127.0.0.1/32 -j ACCEPT"), rule("-p tcp -m tcp --dport 443 -j ACCEPT"))
+    assert not rule_optimizer.can_swap(rule("-s 127.0.0.1/32 -j ACCEPT"), rule("-p tcp -j DROP"))
+    recent = rule("-m recent --rcheck --seconds 300 --hitcount 50 --name DEFAULT --rsource -j DROP")
+    assert not rule_optimizer.can_swap(recent, rule("-p tcp -j DROP"))
+    assert not rule_optimizer.can_swap(rule("-p tcp -j DROP"), recent)
+
+
+def test_optimize_order_keeps_established_below_recent_set():
+    rules = saved_rules()
+    counters = firewall_metrics.parse_rule_counters(SAVED)
+    ordered = [counter.rule for counter in rule_optimizer.optimize_order(counters)]
+
+    established = "-A INPUT -m state --state RELATED,ESTABLISHED -j ACCEPT"
+    recent_set = "-A INPUT -m recent --set --name DEFAULT --mask 255.255.255.255 --rsource"
+    assert ordered.index(established) > ordered.index(recent_set)
+    # The hot HTTPS rule moves past the rules it commutes with; the rest keep their order.
+    https = "-A INPUT -p tcp -m tcp --dport 443 -m state --state NEW -j ACCEPT"
+    assert ordered[0] == https
+    assert [r for r in ordered if r != https] == [counter.rule for counter in counters if counter.rule != https]
+    assert sorted(ordered) == sorted(rules)
+    assert (rule_optimizer.average_traversal([rules[r].packets for r in ordered])
+            < rule_optimizer.average_traversal([counter.packets for counter in counters]))
@@ -0,0 +1,81 @@
+import pytest
+
+pytest.importorskip("boto3")
+pytest.importorskip("moto")
+
+import firewall_script
+
+DESIRED = firewall_script.desired_ingress_rules([80, 443, 22], "0.0.0.0/0")
+
+
+@pytest.fixture
+def group_ids(ec2):
+    vpc_id = ec2.create_vpc(CidrBlock="10.0.0.0/16")["Vpc"]["VpcId"]
+    return [ec2.create_security_group(GroupName=f"web-{i}", Description="web", VpcId=vpc_id)["GroupId"]
+            for i in range(3)]
+
+
+def current_rules(ec2, group_id):
+    group = ec2.describe_security_groups(GroupIds=[group_id])["SecurityGroups"][0]
+    return firewall_script.ingress_rules(group["IpPermissions"])
+
+
+def test_out_of_band_change_is_repaired_on_the_next_pass(ec2, group_ids):
+    assert firewall_script.reconcile_security_groups(group_ids, DESIRED, client=ec2) == 0
+    ec2.revoke_security_group_ingress(GroupId=group_ids[0], IpPermissions=firewall_script.ip_permissions(
+        {("tcp", 22, 22, "0.0.0.0/0")}))
+
+    assert firewall_script.reconcile_security_groups(group_ids, DESIRED, client=ec2) == 0
+    assert current_rules(ec2, group_ids[0]) == DESIRED
+
+
+def test_missing_groups_count_as_failures(ec2, group_ids):
+    failures = firewall_script.reconcile_security_groups(group_ids + ["sg-0123456789abcdef0"], DESIRED, client=ec2)
+    assert failures == 1
+    for group_id in group_ids:
+        assert current_rules(ec2, group_id) == DESIRED
+
+
+def count_calls(client, operation):
+    """Count the API calls client makes to one EC2 operation."""
+    calls = []
+    client.meta.events.register(f"before-call.ec2.{operation}", lambda **kwargs: calls.append(kwargs))
+    return calls
+
+
+def test_setup_authorizes_every_port_in_one_call(ec2, group_ids, monkeypatch):
+    monkeypatch.setattr(firewall_script, "SECURITY_GROUP_ID", group_ids[0])
+    monkeypatch.setattr(firewall_script, "ec2_client", lambda: ec2)
+    authorize = count_calls(ec2, "AuthorizeSecurityGroupIngress")
+
+    firewall_script.setup_security_group()
+    assert len(authorize) == 1
+    assert current_rules(ec2, group_ids[0]) == firewall_script.desired_ingress_rules()
+
+
+def test_rerun_changes_nothing(ec2, group_ids, monkeypatch):
+    monkeypatch.setattr(firewall_script, "SECURITY_GROUP_ID", group_ids[0])
+    monkeypatch.setattr(firewall_script, "ec2_client", lambda: ec2)
+    firewall_script.setup_security_group()
+    extra = ("tcp", 8080, 8080, "10.0.0.0/8")
+    ec2.authorize_security_group_ingress(GroupId=group_ids[0], IpPermissions=firewall_script.ip_permissions({extra}))
+
+    authorize = count_calls(ec2, "AuthorizeSecurityGroupIngress")
+    revoke = count_calls(ec2, "RevokeSecurityGroupIngress")
+    firewall_script.setup_security_group()
+    assert authorize == [] and revoke == []
+    # Rules the setup did not ask for are left alone.
+    assert current_rules(ec2, group_ids[0]) == firewall_script.desired_ingress_rules() | {extra}
+
+
+def test_duplicate_rule_is_retried_after_describing_again(ec2, group_ids, monkeypatch):
+    group_id = group_ids[0]
+    ec2.authorize_security_group_ingress(GroupId=group_id, IpPermissions=firewall_script.ip_permissions(
+        {("tcp", 22, 22, "0.0.0.0/0")}))
+    authorize = count_calls(ec2, "AuthorizeSecurityGroupIngress")
+
+    # The group is reconciled from a stale view that misses the port 22 rule.
+    result = firewall_script.reconcile_security_group(ec2, group_id, set(), DESIRED, revoke=False)
+    assert result == (2, 0)
+    assert len(authorize) == 2
+    assert current_rules(ec2, group_id) == DESIRED